@@ -0,0 +1,186 @@
+import sys
+import threading
+from collections import OrderedDict
+
+import pygame
+
+import Bundle
+
+
+# Shared image, sound, font and text cache. Every image is loaded from disk, decoded and converted once, then the
+# same Surface is handed to every entity that asks for it. Nothing in here should ever be drawn on directly because
+# it is shared. If an asset bundle is in use, assets come from it instead of the individual files.
+class AssetManager(object):
+    def __init__(self, image_dir="images", sound_dir="sounds", max_unused=32, max_texts=256):
+        self.image_dir = image_dir
+        self.sound_dir = sound_dir
+        self.bundle = None
+        # How many images that aren't pinned can stay in the cache before the least recently used one is dropped
+        self.max_unused = max_unused
+        self.images = OrderedDict()
+        self.pinned = set()
+        self.loads = 0
+        # Levels builds blocks on its loading thread and scenes are got ready on another (see Scene.ScenePreload),
+        # and both get images and fonts from here as well
+        self.lock = threading.RLock()
+
+        self.sounds = {}
+        self.fonts = {}
+        # Rendered text, least recently used first
+        self.max_texts = max_texts
+        self.texts = OrderedDict()
+
+    # Images are stored by name, whether they have per pixel alpha and the size they were scaled to
+    def image(self, name, alpha=False, size=None):
+        key = (name, alpha, size)
+        with self.lock:
+            surface = self.images.get(key)
+            if surface is None:
+                surface = self.load_image(name, alpha, size)
+                self.images[key] = surface
+                self.evict()
+            else:
+                self.images.move_to_end(key)
+        return surface
+
+    # Opens an asset bundle built by Bundle.py. Returns False and keeps using the files if it can't be opened, or if
+    # any of the files changed after it was built so it would show old assets.
+    def use_bundle(self, path):
+        try:
+            bundle = Bundle.Bundle(path)
+        except (OSError, Bundle.BundleError):
+            self.bundle = None
+            return False
+        stale = bundle.stale_sources()
+        if stale:
+            changed = ", ".join(stale[:3]) + (" and %d more" % (len(stale) - 3) if len(stale) > 3 else "")
+            print("Assets: %s is older than %s, using the files instead (rebuild it with python Bundle.py)"
+                  % (path, changed), file=sys.stderr)
+            bundle.close()
+            bundle = None
+        self.bundle = bundle
+        return self.bundle is not None
+
+    def load_image(self, name, alpha, size):
+        self.loads += 1
+        if self.bundle is not None and self.bundle.has_image(name):
+            surface = self.bundle.image(name)
+            # bundle surfaces share memory with the mapped file, so they always get copied
+            if pygame.display.get_surface() is None:
+                surface = surface.copy()
+        else:
+            surface = pygame.image.load(self.image_dir + "/" + name + ".png")
+        # convert needs a display mode, so an image loaded before set_mode (like the icon) is kept as it is
+        if pygame.display.get_surface() is not None:
+            surface = surface.convert_alpha() if alpha else surface.convert()
+        if size is not None:
+            surface = pygame.transform.scale(surface, size)
+        return surface
+
+    # Loads a list of (name, alpha, size) images up front and stops them from ever being evicted
+    def preload(self, images):
+        for name, alpha, size in images:
+            self.image(name, alpha, size)
+            self.pinned.add((name, alpha, size))
+
+    def unpin(self, name, alpha=False, size=None):
+        self.pinned.discard((name, alpha, size))
+        self.evict()
+
+    # Drops least recently used images until only max_unused unpinned images are left.
+    # Entities that still hold the surface keep it alive, it just won't be shared with anything new.
+    def evict(self):
+        with self.lock:
+            unpinned = [key for key in self.images if key not in self.pinned]
+            for key in unpinned[:max(0, len(unpinned) - self.max_unused)]:
+                del self.images[key]
+
+    # Sounds are only loaded once too. They need the mixer, so they are played through Audio, which doesn't
+    # load anything when there is no mixer.
+    def sound(self, name):
+        sound = self.sounds.get(name)
+        if sound is None:
+            if self.bundle is not None and self.bundle.has_sound(name):
+                sound = self.bundle.sound(name)
+            else:
+                sound = pygame.mixer.Sound(self.sound_dir + "/" + name + ".wav")
+            self.sounds[name] = sound
+        return sound
+
+    # Fonts are shared by name and size. A name ending in .ttf is a font file, anything else is a system font.
+    def font(self, name, size):
+        key = (name, size)
+        font = self.fonts.get(key)
+        if font is None:
+            with self.lock:
+                font = self.fonts.get(key)
+                if font is None:
+                    if self.bundle is not None and self.bundle.has_font(name):
+                        font = self.bundle.font(name, size)
+                    elif name.endswith(".ttf"):
+                        font = pygame.font.Font(name, size)
+                    else:
+                        font = pygame.font.SysFont(name, size)
+                    self.fonts[key] = font
+        return font
+
+    # Renders a line of text once and reuses the surface until it falls out of the cache,
+    # so text that doesn't change between frames only costs a blit
+    def text(self, font_name, size, text, colour, antialias=True):
+        key = (font_name, size, text, colour, antialias)
+        surface = self.texts.get(key)
+        if surface is None:
+            surface = self.font(font_name, size).render(text, antialias, colour)
+            self.texts[key] = surface
+            if len(self.texts) > self.max_texts:
+                self.texts.popitem(last=False)
+        else:
+            self.texts.move_to_end(key)
+        return surface
+
+    def clear(self):
+        self.images.clear()
+        self.pinned.clear()
+        self.texts.clear()
+
+
+# Every image the game needs while playing. Preloaded once the display exists so building a scene
+# or swapping a gold block never touches the disk. Sounds are loaded by Audio.init.
+GAME_IMAGES = [
+    ("red", False, None),
+    ("yellow", False, None),
+    ("green", False, None),
+    ("blue", False, None),
+    ("purple", False, None),
+    ("gold", True, None),
+    ("paddle", False, None),
+    ("ball", True, (20, 20)),
+    ("gameover", True, None),
+    ("logo", True, None),
+]
+
+manager = AssetManager()
+
+
+def image(name, alpha=False, size=None):
+    return manager.image(name, alpha, size)
+
+
+def sound(name):
+    return manager.sound(name)
+
+
+def font(name, size):
+    return manager.font(name, size)
+
+
+def text(font_name, size, text, colour, antialias=True):
+    return manager.text(font_name, size, text, colour, antialias)
+
+
+def use_bundle(path=Bundle.DEFAULT_PATH):
+    return manager.use_bundle(path)
+
+
+def preload(images=GAME_IMAGES):
+    manager.preload(images)
@@ -0,0 +1,111 @@
+import time
+from collections import deque
+
+import pygame
+
+import Assets
+
+# Every sound the game plays: its category and the shortest time in ms between two plays of it. A sound asked for
+# again inside that window is dropped, so a burst of hits in one step (multiball, or the ball clipping a few blocks
+# at once) is heard as one hit instead of flooding the mixer.
+SOUNDS = {
+    "hit": ("hit", 40),
+    "wall_hit": ("wall", 40),
+    "game_over": ("event", 0),
+}
+
+# How many mixer channels each category gets to itself. A category can only ever use its own channels, so block
+# hits can't cut off the game over sound however many of them there are.
+CATEGORIES = {
+    "hit": 2,
+    "wall": 2,
+    "event": 1,
+}
+
+
+# Plays sounds on reserved channels. Sounds are loaded once through Assets when the manager is made.
+class AudioManager(object):
+    def __init__(self, sounds=SOUNDS, categories=CATEGORIES):
+        self.definitions = sounds
+        self.sounds = {}
+        self.last_played = {}
+        # how many plays were dropped by the rate limit, for tuning the windows
+        self.dropped = 0
+
+        # Channels 0 to total - 1 are reserved, so pygame never hands them out to anything else
+        total = sum(categories.values())
+        if pygame.mixer.get_num_channels() < total:
+            pygame.mixer.set_num_channels(total)
+        pygame.mixer.set_reserved(total)
+        # each category's channels, least recently started first
+        self.channels = {}
+        first = 0
+        for category, count in categories.items():
+            self.channels[category] = deque(pygame.mixer.Channel(i) for i in range(first, first + count))
+            first += count
+
+        for name in sounds:
+            self.sounds[name] = Assets.sound(name)
+
+    # Plays a sound unless it was played too recently. Returns the channel it plays on, or None if it was dropped.
+    def play(self, name):
+        category, min_interval = self.definitions[name]
+        now = time.perf_counter() * 1000
+        last = self.last_played.get(name)
+        if last is not None and now - last < min_interval:
+            self.dropped += 1
+            return None
+        self.last_played[name] = now
+
+        channel = self.find_channel(category)
+        channel.play(self.sounds[name])
+        return channel
+
+    # A free channel of the category, or if they are all busy the one that started playing longest ago
+    def find_channel(self, category):
+        channels = self.channels[category]
+        for channel in channels:
+            if not channel.get_busy():
+                break
+        else:
+            channel = channels[0]
+        channels.remove(channel)
+        channels.append(channel)
+        return channel
+
+    def stop(self):
+        for channels in self.channels.values():
+            for channel in channels:
+                channel.stop()
+
+
+# Used when there is no mixer, like when running headless. Nothing is loaded and nothing is played.
+class NullAudio(object):
+    dropped = 0
+
+    def play(self, name):
+        return None
+
+    def stop(self):
+        pass
+
+
+backend = NullAudio()
+
+
+# Picks the backend once pygame is set up. The mixer is never opened here, so without one the game stays silent.
+def init():
+    global backend
+    if pygame.mixer.get_init() is None:
+        backend = NullAudio()
+    else:
+        backend = AudioManager()
+    return backend
+
+
+def play(name):
+    return backend.play(name)
+
+
+def stop():
+    backend.stop()
@@ -1,8 +1,19 @@
+import argparse
+import os
 import sys
+import time
 
 import pygame
 
+import Assets
+import Audio
+import Display
+import Events
 import GuiScreens
+import Profiler
+import Replay
+import Scene
+from GameScene import GameScene
 
 
 class BasicGame:
@@ -12,6 +23,31 @@ class BasicGame:
     # Mouse if True, Keyboard if False
     mouse_or_keyboard = True
 
+    # The game logic runs in fixed steps of 1/physics_rate seconds however fast frames are drawn, so the game plays
+    # at the same speed when rendering slows down. If a frame takes longer than max_steps_per_frame steps, the
+    # rest of the time is dropped so a slow machine doesn't fall further and further behind (the spiral of death).
+    physics_rate = 120
+    max_steps_per_frame = 8
+
+    # Assets are read from this bundle if it exists (build it with python Bundle.py). None always uses the files.
+    bundle_path = "assets.bundle"
+
+    # Every game is recorded and saved here when it ends, so it can be played again with python Replay.py.
+    # None turns recording off.
+    replay_path = "replays/last_game.replay"
+
+    # Frame timings are always recorded for the last profile_frames frames. Press 3 to save them as CSV in
+    # profile_dir, and they are saved as JSON there when the game is closed.
+    profile_dir = "profiles"
+    profile_frames = 600
+
+    # The game is always drawn at resolution and scaled to fit the window, which can be resized. window_size is the
+    # size the window opens at, the same as resolution if it is None (see Display.DisplayContext). quality is how it is
+    # scaled, Display.FAST is cheaper than Display.SMOOTH on slow machines.
+    resolution = Display.RESOLUTION
+    window_size = None
+    quality = Display.SMOOTH
+
     def __init__(self):
         self.initialize()
         self.main_loop()
@@ -25,73 +61,201 @@ class BasicGame:
         pygame.init()
         pygame.font.init()
 
-        self.font = pygame.font.SysFont("Arial", 15)
-
-        self.width = 800
-        self.height = 600
-        self.screen = pygame.display.set_mode((self.width, self.height))
+        self.display = Display.init(self.resolution, self.window_size, self.quality)
+        self.width, self.height = self.display.resolution
+        self.screen = self.display.canvas
 
         self.caption = "Breakout"
         pygame.display.set_caption(self.caption)
 
         self.framerate = 60
+        self.step_ms = 1000 / self.physics_rate
+        # Game time only moves on one physics step at a time
+        self.sim_time = 0
         self.background_color = (255, 255, 255)
 
         self.clock = pygame.time.Clock()
+        # Press 1 to show the FPS, again to show the profiler as well and again to hide both
         self.show_fps = False
+        self.show_profile = False
+        self.profiler = Profiler.FrameProfiler(self.profile_frames)
+
+        # Dirty rectangle rendering only redraws and presents the parts of the screen that changed.
+        # Scenes that don't support it are always drawn in full. Press 2 to switch between the two.
+        self.dirty_rendering = False
+        self.dirty_scene = None
+        self.dirty_rects = []
+
+        # Records the input of the game being played
+        self.recorder = None
+
+        # Decode every image once now so scenes never have to load anything from disk
+        if self.bundle_path is not None:
+            Assets.use_bundle(self.bundle_path)
+        Assets.preload()
+        Audio.init()
+
         # sets the current scene to the title screen.
         self.current_scene = GuiScreens.TitleScreen()
 
         self.icon = pygame.image.load("images/icon.png")
         pygame.display.set_icon(self.icon)
 
-    # main loop method keeps the game running. This method continuously
-    # calls the update and draw methods to keep the game alive.
+    # main loop method keeps the game running. Each frame handles input, runs as many physics steps as
+    # the time since the last frame covers and then draws the game part way between the last two steps.
     def main_loop(self):
+        accumulator = 0
+        last_frame = time.perf_counter()
         while True:
-            gametime = pygame.time.get_ticks()
-            self.update(gametime)
-            self.draw(gametime)
-            self.clock.tick(self.framerate)
+            self.profiler.begin_frame()
+            now = time.perf_counter()
+            accumulator += (now - last_frame) * 1000
+            last_frame = now
 
-    # Update method contains game update logic, such as updating the game
-    # variables, checking for collisions, gathering input, and
-    # playing audio.
-    def update(self, gametime):
+            self.handle_events()
+            self.profiler.lap("events")
+
+            steps = 0
+            while accumulator >= self.step_ms and steps < self.max_steps_per_frame:
+                self.sim_time += self.step_ms
+                self.step(self.sim_time)
+                accumulator -= self.step_ms
+                steps += 1
+            if accumulator >= self.step_ms:
+                # Too far behind to catch up, so let the game slow down instead
+                accumulator = 0
+            self.profiler.lap("update")
+
+            self.draw(self.sim_time, accumulator / self.step_ms)
+            self.clock.tick(self.framerate)
 
-        events = pygame.event.get()
+    def handle_events(self):
+        # A fast mouse can send several motion events a frame, only where it ended up matters
+        events = Events.coalesce_motion(pygame.event.get())
         pressed_keys = pygame.key.get_pressed()
         for event in events:
             if event.type == pygame.QUIT:
+                if self.recorder is not None:
+                    self.recorder.save(self.replay_path)
+                self.profiler.dump(os.path.join(self.profile_dir, "last_session.json"))
                 pygame.quit()
                 sys.exit()
+            if event.type == pygame.VIDEORESIZE:
+                self.display.resize(event.size)
+                self.screen = self.display.canvas
+                self.dirty_scene = None
+            event = self.display.map_event(event)
             if event.type == pygame.KEYDOWN:
                 if event.key == pygame.K_1:
-                    self.show_fps = not self.show_fps
+                    if not self.show_fps:
+                        self.show_fps = True
+                    elif not self.show_profile:
+                        self.show_profile = True
+                    else:
+                        self.show_fps = self.show_profile = False
+                if event.key == pygame.K_2:
+                    self.dirty_rendering = not self.dirty_rendering
+                    self.dirty_scene = None
+                if event.key == pygame.K_3:
+                    self.profiler.dump(os.path.join(self.profile_dir, time.strftime("frames-%Y%m%d-%H%M%S.csv")))
             # pass all events on to the scenes to handle themselves.
-
+            if self.recorder is not None:
+                self.recorder.observe(event)
             self.current_scene.handle_input(event, pressed_keys)
 
+    def step(self, gametime):
         # update current scene
+        if self.recorder is not None:
+            self.recorder.step(gametime)
         self.current_scene.update(gametime)
 
         # Makes sure the current scene is always updated.
+        previous = self.current_scene
         self.current_scene = self.current_scene.next_scene
+        if self.current_scene is not previous:
+            waited_ms = previous.waited_ms if isinstance(previous, Scene.LoadingScene) else None
+            self.profiler.transition(type(previous).__name__, type(self.current_scene).__name__, waited_ms)
+        self.update_recording()
+
+    # Starts recording when a game starts and saves the recording once the game has been left
+    def update_recording(self):
+        if self.recorder is not None and self.recorder.scene is not self.current_scene:
+            self.recorder.save(self.replay_path)
+            self.recorder = None
+        if self.recorder is None and self.replay_path is not None and isinstance(self.current_scene, GameScene):
+            self.recorder = Replay.Recorder(self.current_scene, self.step_ms)
 
-    # Draw method, draws the current state of the game on the screen                        
-    def draw(self, gametime):
+    # Draw method, draws the current state of the game on the screen.
+    # interpolation is how far the frame is between the last physics step and the next one
+    def draw(self, gametime, interpolation=1.0):
+        self.current_scene.interpolation = interpolation
+        if self.dirty_rendering and self.current_scene.supports_dirty_rendering:
+            self.draw_dirty()
+            return
+
+        self.dirty_scene = None
         self.screen.fill(self.background_color)
 
         # show the FPS
         if self.show_fps == True:
-            fps = self.font.render(str(int(self.clock.get_fps())), 1, (0, 0, 0))
+            fps = Assets.text("Arial", 15, str(int(self.clock.get_fps())), (0, 0, 0))
             self.screen.blit(fps, (0, 0))
 
         # render the current scene
         self.current_scene.render(self.screen)
+        if self.show_profile:
+            self.profiler.draw(self.screen)
+        self.profiler.lap("render")
+
+        self.display.present()
+        self.profiler.lap("present")
+
+    # Restores last frame's drawn areas from the scene's background, draws the moving parts on top
+    # and only sends the areas that changed to the display
+    def draw_dirty(self):
+        scene = self.current_scene
+        background = scene.render_background(self.screen, self.background_color)
+
+        full_redraw = scene is not self.dirty_scene
+        if full_redraw:
+            self.screen.blit(background, (0, 0))
+            scene.take_background_changes()
+            self.dirty_scene = scene
+            self.dirty_rects = []
+
+        changed = self.dirty_rects + scene.take_background_changes()
+        for rect in changed:
+            self.screen.blit(background, rect, rect)
+
+        drawn = scene.render_dynamic(self.screen)
+
+        # show the FPS
+        if self.show_fps == True:
+            fps = Assets.text("Arial", 15, str(int(self.clock.get_fps())), (0, 0, 0))
+            drawn.append(self.screen.blit(fps, (0, 0)))
+        if self.show_profile:
+            drawn.append(self.profiler.draw(self.screen))
+        self.profiler.lap("render")
+
+        if full_redraw:
+            self.display.present()
+        else:
+            self.display.present(changed + drawn)
+        self.profiler.lap("present")
+        self.dirty_rects = drawn
+
 
-        pygame.display.flip()
+def main():
+    parser = argparse.ArgumentParser(description="Play Breakout")
+    parser.add_argument("--window", type=int, nargs=2, metavar=("WIDTH", "HEIGHT"),
+                        help="open the window at this size, the game is scaled to fit it")
+    parser.add_argument("--quality", choices=sorted(Display.SCALERS), default=Display.SMOOTH,
+                        help="how the game is scaled to the window: smooth filters it, fast is cheaper but blockier")
+    args = parser.parse_args()
+    BasicGame.window_size = tuple(args.window) if args.window else None
+    BasicGame.quality = args.quality
+    BasicGame()
 
 
 if __name__ == "__main__":
-    game = BasicGame()
+    main()
@@ -0,0 +1,160 @@
+import argparse
+import csv
+import json
+import multiprocessing
+import os
+import random
+import statistics
+import time
+
+# Headless sets up the dummy video and audio drivers, so it has to be imported before anything imports pygame
+import Headless
+import Profiler
+from GameScene import GameScene
+
+# Runs lots of headless games at once, one per core, to see how changing the difficulty settings on GameScene
+# changes how games go. Every episode has its own seed, so running the same batch again gives the same results.
+
+POLICIES = {
+    'autopilot': lambda seed: Headless.Autopilot(random.Random(seed).randint(-30, 30)),
+    'sloppy': lambda seed: Headless.SloppyAutopilot(seed),
+}
+
+METRICS = ['score', 'duration', 'lives_lost', 'blocks_cleared', 'level']
+
+
+# Runs in every worker process before it plays any episodes
+def init_worker(settings):
+    Headless.init()
+    for name, value in settings.items():
+        setattr(GameScene, name, value)
+
+
+# Plays one game and returns what happened. Used from the worker processes.
+def run_episode(job):
+    episode, seed, policy, max_frames, multiball = job
+    scene = GameScene(0, (800, 600), multiball, seed)
+    runner = Headless.HeadlessRunner(scene, POLICIES[policy](seed))
+    stats = runner.run(max_frames)
+
+    if scene.victory_state:
+        result = 'victory'
+    elif scene.game_over_state:
+        result = 'game_over'
+    else:
+        result = 'timeout'
+    return {
+        'episode': episode,
+        'seed': seed,
+        'result': result,
+        'score': scene.score,
+        'duration': stats['simulated_seconds'],
+        # the last life is lost without lives going below 0
+        'lives_lost': 3 - scene.lives + (1 if scene.game_over_state else 0),
+        'blocks_cleared': scene.blocks_cleared,
+        'level': scene.level,
+        'frames': stats['frames'],
+    }
+
+
+def summarise(values):
+    values = sorted(values)
+    return {
+        'mean': statistics.mean(values),
+        'stdev': statistics.pstdev(values),
+        'min': values[0],
+        'p10': Profiler.percentile(values, 10),
+        'p50': Profiler.percentile(values, 50),
+        'p90': Profiler.percentile(values, 90),
+        'max': values[-1],
+    }
+
+
+# Plays every episode across a pool of processes and returns the episodes in order
+def run_batch(episodes, seed=0, policy='sloppy', max_frames=36000, multiball=0, workers=None, settings=None):
+    workers = workers or os.cpu_count() or 1
+    jobs = [(i, seed + i, policy, max_frames, multiball) for i in range(episodes)]
+    # a few chunks per worker so a worker with long games doesn't hold up the end of the batch
+    chunksize = max(1, episodes // (workers * 4))
+    pool = multiprocessing.Pool(workers, init_worker, (settings or {},))
+    try:
+        results = list(pool.imap_unordered(run_episode, jobs, chunksize))
+        pool.close()
+    except BaseException:
+        pool.terminate()
+        raise
+    finally:
+        pool.join()
+    results.sort(key=lambda r: r['episode'])
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Play many headless games in parallel and summarise how they went")
+    parser.add_argument("--episodes", type=int, default=100)
+    parser.add_argument("--seed", type=int, default=0, help="seed of the first episode, the others count up from it")
+    parser.add_argument("--workers", type=int, default=None, help="number of processes (default: one per core)")
+    parser.add_argument("--max-frames", type=int, default=36000, help="give up on a game after this many frames")
+    parser.add_argument("--policy", choices=sorted(POLICIES), default="sloppy",
+                        help="autopilot never misses, sloppy can lose lives")
+    parser.add_argument("--multiball", type=int, default=0)
+    parser.add_argument("--speed-up-times", type=int, nargs=2, metavar=("FIRST", "SECOND"),
+                        help="ms of play before each speed up (default: %d %d)" % GameScene.speed_up_times)
+    parser.add_argument("--gold-interval", type=int, help="ms between gold blocks (default: %d)"
+                                                          % GameScene.gold_block_interval)
+    parser.add_argument("--launch-xspeed", type=float, help="largest x speed at launch (default: %g)"
+                                                            % GameScene.launch_xspeed)
+    parser.add_argument("--out", default="batch_summary.json", help="where to write the summary")
+    parser.add_argument("--csv", help="also write every episode to this CSV file")
+    args = parser.parse_args()
+
+    settings = {}
+    if args.speed_up_times is not None:
+        settings['speed_up_times'] = tuple(args.speed_up_times)
+    if args.gold_interval is not None:
+        settings['gold_block_interval'] = args.gold_interval
+    if args.launch_xspeed is not None:
+        settings['launch_xspeed'] = args.launch_xspeed
+
+    workers = args.workers or os.cpu_count() or 1
+    start = time.perf_counter()
+    results = run_batch(args.episodes, args.seed, args.policy, args.max_frames, args.multiball, workers, settings)
+    wall_time = time.perf_counter() - start
+
+    outcomes = {}
+    for r in results:
+        outcomes[r['result']] = outcomes.get(r['result'], 0) + 1
+    summary = {
+        'episodes': len(results),
+        'seed': args.seed,
+        'policy': args.policy,
+        'max_frames': args.max_frames,
+        'multiball': args.multiball,
+        'settings': {name: getattr(GameScene, name) for name in ('speed_up_times', 'gold_block_interval',
+                                                                 'launch_xspeed')},
+        'workers': workers,
+        'wall_seconds': wall_time,
+        'results': outcomes,
+        'metrics': {name: summarise([r[name] for r in results]) for name in METRICS} if results else {},
+    }
+    summary['settings'].update(settings)
+
+    with open(args.out, "w") as f:
+        json.dump(summary, f, indent=2)
+    if args.csv:
+        with open(args.csv, "w", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=list(results[0]) if results else ['episode'])
+            writer.writeheader()
+            writer.writerows(results)
+
+    print("%d episodes on %d workers in %.1f s" % (len(results), workers, wall_time))
+    for name in METRICS:
+        if results:
+            m = summary['metrics'][name]
+            print("%-15s mean %8.1f  p50 %8.1f  min %8.1f  max %8.1f" % (name, m['mean'], m['p50'], m['min'], m['max']))
+    print("results: %s" % ", ".join("%s %d" % item for item in sorted(outcomes.items())))
+    print("summary written to %s" % args.out)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,157 @@
+import io
+import json
+import mmap
+import os
+import struct
+import sys
+
+import pygame
+
+# An asset bundle is one file holding every image as raw RGBA pixels, every sound as raw mixer samples and the font.
+# The loader memory maps it, so starting the game is one open instead of one open and decode per asset.
+#
+# Layout: MAGIC, a little endian uint32 with the length of the JSON index, the index, then the data.
+# Every index entry has the offset and length of its data, counted from the end of the index, and the path, size and
+# mtime of the file it was built from, so the game can tell when the bundle is older than the files.
+MAGIC = b"BRKBNDL1"
+HEADER = struct.Struct("<8sI")
+
+# The sounds are stored in the format the game opens the mixer with (see BasicGame.initialize)
+MIXER_FORMAT = (44100, -16, 2)
+
+DEFAULT_PATH = "assets.bundle"
+
+
+# What a bundle remembers about the file an asset was built from
+def source_info(path):
+    stat = os.stat(path)
+    return {"path": path, "size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+
+# Packs images/*.png, sounds/*.wav and the .ttf fonts in the current directory into a bundle
+def build(path=DEFAULT_PATH, image_dir="images", sound_dir="sounds", font_dir="."):
+    if pygame.mixer.get_init() is None:
+        pygame.mixer.init(*MIXER_FORMAT)
+    if pygame.mixer.get_init() != MIXER_FORMAT:
+        raise ValueError("the mixer must be opened as %r to build a bundle, not %r"
+                         % (MIXER_FORMAT, pygame.mixer.get_init()))
+
+    index = {"images": {}, "sounds": {}, "fonts": {}, "mixer": list(MIXER_FORMAT)}
+    blobs = []
+    data_length = 0
+
+    def add(section, name, source, data, **info):
+        nonlocal data_length
+        blobs.append(data)
+        index[section][name] = dict(info, offset=data_length, length=len(data), source=source_info(source))
+        data_length += len(data)
+
+    for filename in sorted(os.listdir(image_dir)):
+        name, ext = os.path.splitext(filename)
+        if ext == ".png":
+            source = os.path.join(image_dir, filename)
+            surface = pygame.image.load(source)
+            add("images", name, source, pygame.image.tobytes(surface, "RGBA"), size=list(surface.get_size()))
+
+    for filename in sorted(os.listdir(sound_dir)):
+        name, ext = os.path.splitext(filename)
+        if ext == ".wav":
+            source = os.path.join(sound_dir, filename)
+            add("sounds", name, source, pygame.mixer.Sound(source).get_raw())
+
+    for filename in sorted(os.listdir(font_dir)):
+        if filename.endswith(".ttf"):
+            source = os.path.join(font_dir, filename)
+            with open(source, "rb") as f:
+                add("fonts", filename, source, f.read())
+
+    index_bytes = json.dumps(index).encode("utf-8")
+
+    # Written to a temporary file first so a half written bundle is never picked up by the game
+    with open(path + ".tmp", "wb") as f:
+        f.write(HEADER.pack(MAGIC, len(index_bytes)))
+        f.write(index_bytes)
+        for blob in blobs:
+            f.write(blob)
+    os.replace(path + ".tmp", path)
+    return index
+
+
+class BundleError(Exception):
+    pass
+
+
+# Memory maps a bundle and builds Surfaces, Sounds and Fonts straight from it
+class Bundle(object):
+    def __init__(self, path=DEFAULT_PATH):
+        self.path = path
+        self.file = open(path, "rb")
+        try:
+            self.data = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+            magic, index_length = HEADER.unpack_from(self.data, 0)
+            if magic != MAGIC:
+                raise BundleError("%s is not an asset bundle" % path)
+            self.index = json.loads(bytes(self.data[HEADER.size:HEADER.size + index_length]).decode("utf-8"))
+            self.data_start = HEADER.size + index_length
+        except (ValueError, struct.error) as e:
+            self.file.close()
+            raise BundleError("%s is corrupt: %s" % (path, e))
+        self.view = memoryview(self.data)
+
+    def blob(self, section, name):
+        entry = self.index[section][name]
+        start = self.data_start + entry["offset"]
+        return self.view[start:start + entry["length"]]
+
+    def has_image(self, name):
+        return name in self.index["images"]
+
+    # The surface points straight into the mapped file, so it has to be converted or copied before the bundle closes
+    def image(self, name):
+        return pygame.image.frombuffer(self.blob("images", name), tuple(self.index["images"][name]["size"]), "RGBA")
+
+    # Raw samples only make sense if the mixer was opened in the same format they were stored in
+    def has_sound(self, name):
+        return name in self.index["sounds"] and pygame.mixer.get_init() == tuple(self.index["mixer"])
+
+    def sound(self, name):
+        return pygame.mixer.Sound(buffer=self.blob("sounds", name))
+
+    def has_font(self, name):
+        return name in self.index["fonts"]
+
+    # pygame keeps reading the file object while the font is alive, so every font gets its own copy
+    def font(self, name, size):
+        return pygame.font.Font(io.BytesIO(self.blob("fonts", name)), size)
+
+    # Paths of the files that have changed, gone or were never recorded since the bundle was built
+    def stale_sources(self):
+        stale = []
+        for section in ("images", "sounds", "fonts"):
+            for name, entry in sorted(self.index[section].items()):
+                source = entry.get("source")
+                if source is None:
+                    stale.append(name)
+                    continue
+                try:
+                    current = source_info(source["path"])
+                except OSError:
+                    current = None
+                if current != source:
+                    stale.append(source["path"])
+        return stale
+
+    def close(self):
+        self.view.release()
+        self.data.close()
+        self.file.close()
+
+
+if __name__ == "__main__":
+    os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+    pygame.mixer.pre_init(*MIXER_FORMAT)
+    pygame.init()
+    out = sys.argv[1] if len(sys.argv) > 1 else DEFAULT_PATH
+    built = build(out)
+    print("Wrote %s: %d images, %d sounds, %d fonts, %d bytes" % (out, len(built["images"]), len(built["sounds"]),
+                                                                   len(built["fonts"]), os.path.getsize(out)))
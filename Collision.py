@@ -0,0 +1,190 @@
+import pygame
+
+
+# Uniform grid broadphase. Every item is stored in each cell its rect overlaps, so a query only has to look at
+# the handful of cells under the rect instead of every item in the level. Items must have a rect attribute.
+# Blocks are laid out on a 65x20 lattice, so by default one block sits in one cell.
+class UniformGrid(object):
+    def __init__(self, cell_width=65, cell_height=20, origin=(0, 0)):
+        self.cell_width = cell_width
+        self.cell_height = cell_height
+        self.origin = origin
+        self.cells = {}
+        # remembers which cells each item was put in, so it can be removed without searching
+        self.item_cells = {}
+
+    def __len__(self):
+        return len(self.item_cells)
+
+    def __contains__(self, item):
+        return item in self.item_cells
+
+    # Turns a rect into the range of cells it covers
+    def cell_range(self, rect):
+        x0 = int((rect.left - self.origin[0]) // self.cell_width)
+        y0 = int((rect.top - self.origin[1]) // self.cell_height)
+        x1 = int((rect.right - 1 - self.origin[0]) // self.cell_width)
+        y1 = int((rect.bottom - 1 - self.origin[1]) // self.cell_height)
+        return x0, y0, x1, y1
+
+    def insert(self, item):
+        x0, y0, x1, y1 = self.cell_range(item.rect)
+        keys = []
+        for cy in range(y0, y1 + 1):
+            for cx in range(x0, x1 + 1):
+                self.cells.setdefault((cx, cy), {})[item] = None
+                keys.append((cx, cy))
+        self.item_cells[item] = keys
+
+    def remove(self, item):
+        for key in self.item_cells.pop(item, ()):
+            cell = self.cells[key]
+            del cell[item]
+            if not cell:
+                del self.cells[key]
+
+    # Call this after an item's rect changes, e.g. when a block turns gold and gets bigger.
+    # Items that have already been removed are left out.
+    def move(self, item):
+        if item in self.item_cells:
+            self.remove(item)
+            self.insert(item)
+
+    # Returns every item in the cells the rect overlaps, in the order they were inserted into the cell.
+    # These are only candidates, they still need a proper rect test.
+    def query(self, rect):
+        x0, y0, x1, y1 = self.cell_range(rect)
+        found = {}
+        for cy in range(y0, y1 + 1):
+            for cx in range(x0, x1 + 1):
+                cell = self.cells.get((cx, cy))
+                if cell:
+                    found.update(cell)
+        return list(found)
+
+    # Returns every item in the cell the point is in, for hit testing the mouse
+    def query_point(self, pos):
+        cell = self.cells.get((int((pos[0] - self.origin[0]) // self.cell_width),
+                               int((pos[1] - self.origin[1]) // self.cell_height)))
+        return list(cell) if cell else []
+
+    def rect_of(self, item):
+        return item.rect
+
+    # Returns the items whose rects actually collide with the rect
+    def colliding(self, rect):
+        return [item for item in self.query(rect) if rect.colliderect(item.rect)]
+
+    def clear(self):
+        self.cells.clear()
+        self.item_cells.clear()
+
+
+# Swept AABB test. Moves a w x h box from (x, y) by (dx, dy) and works out when it first touches rect.
+# Returns (time, normal) where time is 0 to 1 along the move and normal is the side of rect that was hit, e.g. (0, 1)
+# for the bottom. Hitting a corner exactly gives both, e.g. (-1, 1). Returns None if the box never touches rect
+# while moving towards it. A box that already overlaps rect is hit straight away.
+def sweep(x, y, w, h, dx, dy, rect):
+    if dx == 0:
+        if x + w <= rect.left or x >= rect.right:
+            return None
+        x_entry, x_exit = -INFINITY, INFINITY
+    elif dx > 0:
+        x_entry = (rect.left - (x + w)) / dx
+        x_exit = (rect.right - x) / dx
+    else:
+        x_entry = (rect.right - x) / dx
+        x_exit = (rect.left - (x + w)) / dx
+
+    if dy == 0:
+        if y + h <= rect.top or y >= rect.bottom:
+            return None
+        y_entry, y_exit = -INFINITY, INFINITY
+    elif dy > 0:
+        y_entry = (rect.top - (y + h)) / dy
+        y_exit = (rect.bottom - y) / dy
+    else:
+        y_entry = (rect.bottom - y) / dy
+        y_exit = (rect.top - (y + h)) / dy
+
+    entry = max(x_entry, y_entry)
+    leave = min(x_exit, y_exit)
+    if entry > leave or entry > 1 or leave <= 0:
+        return None
+
+    # The side that was hit is the axis the box started overlapping on last
+    normal_x = -sign(dx) if x_entry >= y_entry else 0
+    normal_y = -sign(dy) if y_entry >= x_entry else 0
+    return max(entry, 0), (normal_x, normal_y)
+
+
+# Continuous collision for a moving box. Moves it from (x, y) by velocity (the movement for the whole step) and
+# stops at every item it hits on the way, in the order it hits them. Candidates come from the grid plus the
+# items in others. At each impact respond(impacts, x, y) is called with the (item, normal) pairs hit at that moment
+# and where the box is, and must return the velocity for the rest of the step, so the box can bounce off several
+# things in one step. Without respond the box just reflects.
+# The grid can be anything with query(rect) and rect_of(item), like a UniformGrid or an Entities.BlockField.
+# can_hit(item, normal) can turn down a hit, e.g. to make something one-sided. Each item is only hit once a step.
+# Returns the final position and a list of (time, item, normal) for every hit.
+def sweep_box(x, y, w, h, velocity, grid, others=(), respond=None, can_hit=None, max_hits=8):
+    hits = []
+    hit_items = set()
+    time = 0.0
+    dx, dy = velocity
+    while time < 1 and len(hits) < max_hits:
+        move_x = dx * (1 - time)
+        move_y = dy * (1 - time)
+        if move_x == 0 and move_y == 0:
+            break
+
+        # broadphase over everything the box passes through for the rest of the step
+        left = min(x, x + move_x)
+        top = min(y, y + move_y)
+        swept = pygame.Rect(int(left) - 1, int(top) - 1, int(abs(move_x) + w) + 3, int(abs(move_y) + h) + 3)
+        candidates = [(item, grid.rect_of(item)) for item in grid.query(swept)]
+        candidates += [(item, item.rect) for item in others if swept.colliderect(item.rect)]
+
+        first = None
+        impacts = []
+        for item, rect in candidates:
+            if item in hit_items:
+                continue
+            result = sweep(x, y, w, h, move_x, move_y, rect)
+            if result is None or (can_hit is not None and not can_hit(item, result[1])):
+                continue
+            if first is None or result[0] < first - 1e-9:
+                first = result[0]
+                impacts = [(item, result[1])]
+            elif abs(result[0] - first) <= 1e-9:
+                # hitting two blocks at the same moment, e.g. right on the seam between them
+                impacts.append((item, result[1]))
+
+        if first is None:
+            x += move_x
+            y += move_y
+            break
+
+        x += move_x * first
+        y += move_y * first
+        time += (1 - time) * first
+        for item, normal in impacts:
+            hit_items.add(item)
+            hits.append((time, item, normal))
+
+        if respond is None:
+            # plain reflection, once per axis however many items were hit
+            if any(normal[0] for item, normal in impacts):
+                dx = -dx
+            if any(normal[1] for item, normal in impacts):
+                dy = -dy
+        else:
+            dx, dy = respond(impacts, x, y)
+
+    return x, y, hits
+
+
+def sign(value):
+    return (value > 0) - (value < 0)
+
+
+INFINITY = float("inf")
@@ -0,0 +1,103 @@
+import pygame
+
+# The size the game is drawn at. Every scene is laid out for it, whatever size the window is.
+RESOLUTION = (800, 600)
+# The bars either side of the game when the window isn't the same shape as it
+BORDER_COLOUR = (0, 0, 0)
+
+SCALED_EVENTS = (pygame.MOUSEMOTION, pygame.MOUSEBUTTONDOWN, pygame.MOUSEBUTTONUP)
+
+# How the canvas is resampled to fit the window. SMOOTH filters it, FAST takes the nearest pixel, which is two or three
+# times quicker and looks blockier (but just as sharp when the window is a whole number of times the resolution).
+SMOOTH = "smooth"
+FAST = "fast"
+SCALERS = {SMOOTH: pygame.transform.smoothscale, FAST: pygame.transform.scale}
+
+
+# The window and what the game is drawn on. Scenes always draw on canvas, at the internal resolution, and present
+# scales it to the window once a frame, as big as it fits without changing its shape. When the window is exactly the
+# internal resolution the canvas is the window itself, so nothing is scaled or copied.
+#
+# Everything about the window's size is worked out when it is made and again by resize, never during a frame.
+class DisplayContext(object):
+    def __init__(self, resolution=RESOLUTION, window_size=None, flags=pygame.RESIZABLE, quality=SMOOTH):
+        self.resolution = tuple(resolution)
+        self.flags = flags
+        self.quality = quality
+        self.scale = SCALERS[quality]
+        pygame.display.set_mode(window_size or self.resolution, flags)
+        self.canvas = None
+        self.resize()
+
+    # Called when the window changes size (on VIDEORESIZE), with its new size
+    def resize(self, size=None):
+        window = pygame.display.get_surface()
+        if size is not None and window.get_size() != tuple(size):
+            window = pygame.display.set_mode(size, self.flags)
+        self.window = window
+        self.window_size = window.get_size()
+
+        # where the frame goes in the window
+        self.target = None
+        if self.window_size == self.resolution:
+            self.viewport = window.get_rect()
+            self.canvas = window
+            return
+
+        window_width, window_height = self.window_size
+        width, height = self.resolution
+        scale = min(window_width / width, window_height / height)
+        size = (max(1, round(width * scale)), max(1, round(height * scale)))
+        self.viewport = pygame.Rect(((window_width - size[0]) // 2, (window_height - size[1]) // 2), size)
+        if self.canvas is None or self.canvas is window or self.canvas.get_size() != self.resolution:
+            self.canvas = pygame.Surface(self.resolution).convert()
+        window.fill(BORDER_COLOUR)
+        self.target = window.subsurface(self.viewport)
+
+    def scaled(self):
+        return self.canvas is not self.window
+
+    # Shows the frame. rects are the parts of the canvas that changed, or None if any of it might have.
+    def present(self, rects=None):
+        if not self.scaled():
+            if rects is None:
+                pygame.display.flip()
+            else:
+                pygame.display.update(rects)
+            return
+
+        self.scale(self.canvas, self.viewport.size, self.target)
+        pygame.display.flip()
+
+    # Where a point in the window is on the canvas. Points in the bars are moved to the nearest edge.
+    def to_canvas(self, pos):
+        if not self.scaled():
+            return pos
+        x = (pos[0] - self.viewport.x) * self.resolution[0] // self.viewport.w
+        y = (pos[1] - self.viewport.y) * self.resolution[1] // self.viewport.h
+        return (min(max(x, 0), self.resolution[0] - 1), min(max(y, 0), self.resolution[1] - 1))
+
+    # Returns the event with its mouse position on the canvas instead of the window, so scenes never see the window
+    def map_event(self, event):
+        if event.type not in SCALED_EVENTS or not self.scaled():
+            return event
+        changes = {'pos': self.to_canvas(event.pos)}
+        if event.type == pygame.MOUSEMOTION:
+            changes['rel'] = (round(event.rel[0] * self.resolution[0] / self.viewport.w),
+                              round(event.rel[1] * self.resolution[1] / self.viewport.h))
+        return pygame.event.Event(event.type, dict(event.dict, **changes))
+
+
+# The game's display once BasicGame has made it. Headless runs never make one.
+context = None
+
+
+def init(resolution=RESOLUTION, window_size=None, quality=SMOOTH):
+    global context
+    context = DisplayContext(resolution, window_size, quality=quality)
+    return context
+
+
+# The size scenes are drawn at
+def size():
+    return context.resolution if context is not None else RESOLUTION
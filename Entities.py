@@ -1,48 +1,160 @@
+import Assets
+import Audio
 import BasicGame
+import Display
 import pygame
+import Render
 
 
-class Block(pygame.sprite.Sprite):
-    number_of_blocks = 0
+# Block colours are stored as these codes. GOLD is never stored, a block is only gold while it is BlockField.gold.
+COLOURS = ("red", "yellow", "green", "blue", "purple", "gold")
+RED, YELLOW, GREEN, BLUE, PURPLE, GOLD = range(len(COLOURS))
+# Points for hitting a block, by colour code
+SCORES = (50, 40, 30, 20, 10, 100)
+# The code of a cell without a block, for BlockField.fill
+EMPTY = 255
+ALIVE_TABLE = bytes(0 if code == EMPTY else 1 for code in range(256))
+COLOUR_TABLE = bytes(0 if code == EMPTY else code for code in range(256))
 
-    def __init__(self, x, y, colour):
-        # Assign an ID to the block, although I don't currently need it
-        self.id = Block.number_of_blocks + 1
-        Block.number_of_blocks += 1
 
-        # Creates a Rect for the block, extremely easy to keep track of position and size
-        self.x = x
-        self.y = y
-        self.original_colour = colour
+# The image of each colour code, scaled to block_size if that isn't the size of the images. The gold block is
+# scaled by the same amount so it still stands out around its cell the same way.
+def block_images(block_size=None):
+    images = [Assets.image(colour) for colour in COLOURS[:GOLD]] + [Assets.image("gold", alpha=True)]
+    width, height = images[RED].get_size()
+    if block_size is None or tuple(block_size) == (width, height):
+        return images
+    gold_width, gold_height = images[GOLD].get_size()
+    gold_size = (gold_width * block_size[0] // width, gold_height * block_size[1] // height)
+    return ([Assets.image(colour, size=tuple(block_size)) for colour in COLOURS[:GOLD]]
+            + [Assets.image("gold", alpha=True, size=gold_size)])
 
-        # Loads the image of the block for the colour specified
-        self.image = pygame.image.load("images/" + colour + ".png").convert()
-        self.rect = pygame.Rect(x, y, self.image.get_width(), self.image.get_height())
-        self.colour = colour
 
-    def make_gold(self):
-        self.colour = "gold"
-        self.image = pygame.image.load("images/" + self.colour + ".png").convert_alpha()
-        self.rect = pygame.Rect(self.x - 5, self.y - 3, self.image.get_width(), self.image.get_height())
+# Every block in a level, on a lattice of cells with at most one block in each. A block is just its index in the
+# lattice (row * columns + column), and everything about it is kept in flat arrays indexed by that, so destroying a
+# block, scoring it and finding the blocks under a rect don't have to search anything.
+class BlockField(object):
+    def __init__(self, columns=12, rows=10, origin=(10, 40), cell_size=(65, 20), block_size=None):
+        self.columns = columns
+        self.rows = rows
+        self.origin = origin
+        self.cell_width, self.cell_height = cell_size
+
+        # colour code of each block, and 1 for each block that is still there
+        self.colours = bytearray(columns * rows)
+        self.alive = bytearray(columns * rows)
+        self.count = 0
+        # index of the gold block, -1 if there isn't one
+        self.gold = -1
+
+        # the shared image of each colour code
+        self.images = block_images(block_size)
+        self.block_width, self.block_height = self.images[RED].get_size()
+        gold_width, gold_height = self.images[GOLD].get_size()
+        self.gold_offset = ((gold_width - self.block_width) // 2, (gold_height - self.block_height) // 2)
+        self.rects = [pygame.Rect(origin[0] + (i % columns) * self.cell_width,
+                                  origin[1] + (i // columns) * self.cell_height, self.block_width, self.block_height)
+                      for i in range(columns * rows)]
+
+    def __len__(self):
+        return self.count
+
+    def add(self, column, row, colour):
+        index = row * self.columns + column
+        if not self.alive[index]:
+            self.alive[index] = 1
+            self.count += 1
+        self.colours[index] = COLOURS.index(colour)
+        return index
+
+    # Sets every cell at once from a byte per cell, row by row, each a colour code or EMPTY
+    def fill(self, cells):
+        if len(cells) != len(self.alive):
+            raise ValueError("%d cells given for a field of %d" % (len(cells), len(self.alive)))
+        # in place, because Multiball may hold a view of alive
+        self.alive[:] = cells.translate(ALIVE_TABLE)
+        self.colours[:] = cells.translate(COLOUR_TABLE)
+        self.count = len(cells) - cells.count(EMPTY)
+        self.gold = -1
+
+    def destroy(self, index):
+        if self.alive[index]:
+            self.alive[index] = 0
+            self.count -= 1
+            if index == self.gold:
+                self.gold = -1
+
+    # The indexes of every block that is still there, in order
+    def live(self):
+        alive = self.alive
+        return [i for i in range(len(alive)) if alive[i]]
+
+    def colour(self, index):
+        return GOLD if index == self.gold else self.colours[index]
+
+    def score(self, index):
+        return SCORES[self.colour(index)]
+
+    # Only one block can be gold at a time. It is bigger than the others, so its rect reaches outside its cell.
+    def make_gold(self, index):
+        self.gold = index
 
     def ungold(self):
-        self.colour = self.original_colour
-        self.image = pygame.image.load("images/" + self.colour + ".png").convert()
-        self.rect = pygame.Rect(self.x, self.y, self.image.get_width(), self.image.get_height())
+        self.gold = -1
+
+    def rect(self, index):
+        rect = self.rects[index]
+        if index == self.gold:
+            image = self.images[GOLD]
+            return pygame.Rect(rect.x - self.gold_offset[0], rect.y - self.gold_offset[1], image.get_width(),
+                               image.get_height())
+        return rect
 
-    def draw(self, screen):
-        screen.blit(self.image, (self.rect.x, self.rect.y))
+    # For Collision.sweep_box, which asks the grid it is given for the rects of the items it returns
+    def rect_of(self, index):
+        return self.rect(index)
 
+    # Returns the blocks in the cells the rect overlaps, plus the gold block if its rect does.
+    # Like UniformGrid.query these are only candidates.
+    def query(self, rect):
+        x0 = max(0, (rect.left - self.origin[0]) // self.cell_width)
+        y0 = max(0, (rect.top - self.origin[1]) // self.cell_height)
+        x1 = min(self.columns - 1, (rect.right - 1 - self.origin[0]) // self.cell_width)
+        y1 = min(self.rows - 1, (rect.bottom - 1 - self.origin[1]) // self.cell_height)
+        alive = self.alive
+        found = [row * self.columns + column for row in range(y0, y1 + 1) for column in range(x0, x1 + 1)
+                 if alive[row * self.columns + column]]
+        if self.gold >= 0 and self.gold not in found and rect.colliderect(self.rect(self.gold)):
+            found.append(self.gold)
+        return found
 
-class Paddle(pygame.sprite.Sprite):
-    def __init__(self):
+    def colliding(self, rect):
+        return [index for index in self.query(rect) if rect.colliderect(self.rect(index))]
 
-        self.image = pygame.image.load("images/paddle.png").convert()
+    def draw(self, queue):
+        queue.extend([(self.images[self.colour(i)], self.rect(i)) for i in self.live()], Render.BACKGROUND)
+
+    # Draws the blocks that overlap rect, in the same order draw does so they overlap each other the same way
+    def draw_area(self, queue, rect):
+        queue.extend([(self.images[self.colour(i)], self.rect(i)) for i in sorted(self.colliding(rect))],
+                     Render.BACKGROUND)
+
+
+class Paddle(object):
+    # display_size is the size of the area the paddle plays in, the whole game if it isn't given
+    def __init__(self, display_size=None):
+
+        self.image = Assets.image("paddle")
+        if display_size is None:
+            display_size = Display.size()
+        self.display_width, self.display_height = display_size
 
         # Rect for position and size
-        self.rect = pygame.Rect(370, pygame.display.Info().current_h - 50, 80, 15)
+        self.rect = pygame.Rect(370, self.display_height - 50, 80, 15)
         self.move_left = False
         self.move_right = False
+        # keyboard movement left over from the last update that didn't add up to a whole pixel
+        self.move_remainder = 0.0
 
     def handle_input(self, event, pressed_keys):
         
@@ -62,30 +174,45 @@ class Paddle(pygame.sprite.Sprite):
                 if event.key == pygame.K_RIGHT:
                     self.move_right = False
     
-    # draws the paddle on the screen
-    def draw(self, screen):
+    # keeps the paddle on the screen and moves it with the keyboard. Called once a physics step,
+    # step_scale is the length of the step in 60ths of a second.
+    def update(self, step_scale=1.0):
         if self.rect.x <= 0:
             self.rect.x = 0
-        elif self.rect.x + self.rect.width >= pygame.display.Info().current_w:
-            self.rect.x = pygame.display.Info().current_w - self.rect.width
+        elif self.rect.x + self.rect.width >= self.display_width:
+            self.rect.x = self.display_width - self.rect.width
         if self.move_left:
-            self.rect.x -= 10
+            self.move(-10 * step_scale)
         elif self.move_right:
-            self.rect.x += 10
-        screen.blit(self.image, (self.rect.x, self.rect.y))
+            self.move(10 * step_scale)
+
+    def move(self, dx):
+        dx += self.move_remainder
+        whole = int(dx)
+        self.move_remainder = dx - whole
+        self.rect.x += whole
+
+    def draw(self, queue):
+        queue.push(self.image, (self.rect.x, self.rect.y), Render.SPRITES)
 
 
-class Ball(pygame.sprite.Sprite):
-    def __init__(self, x, y):
+class Ball(object):
+    def __init__(self, x, y, display_size=None):
         self.rect = pygame.Rect(x, y, 20, 20)
-        self.image = pygame.transform.scale(pygame.image.load("images/ball.png").convert_alpha(), (20, 20))
+        # The exact position, the rect is this rounded to whole pixels. The position before the last update is
+        # kept so the ball can be drawn in between the two when rendering falls between physics steps.
+        self.pos_x = float(self.rect.x)
+        self.pos_y = float(self.rect.y)
+        self.prev_x = self.pos_x
+        self.prev_y = self.pos_y
+        self.image = Assets.image("ball", alpha=True, size=(20, 20))
         self.yspeed = 4.0
         self.xspeed = 0
         self.maxspeed = 8.0
         self.direction = "Right"
-        self.display_width = pygame.display.Info().current_w
-        self.display_height = pygame.display.Info().current_h
-        self.wall_hit_sound = pygame.mixer.Sound("sounds/wall_hit.wav")
+        if display_size is None:
+            display_size = Display.size()
+        self.display_width, self.display_height = display_size
 
     # this function will bounce the ball. supplying the direction makes it bounce in a certain direction
     # other wise it just reverses it's y direction
@@ -124,36 +251,60 @@ class Ball(pygame.sprite.Sprite):
     def launch_mode(self, paddle):
         self.rect.centerx = paddle.rect.centerx
         self.rect.midbottom = paddle.rect.midtop
+        self.place_at_rect()
 
-    def update(self):
-        self.rect.y -= self.yspeed
+    # Moves the exact position to wherever the rect was put, without drawing the ball sliding there
+    def place_at_rect(self):
+        self.pos_x = self.prev_x = float(self.rect.x)
+        self.pos_y = self.prev_y = float(self.rect.y)
 
+    # How far the ball moves in a 60th of a second, as (x, y) in screen directions
+    def velocity(self):
         if self.direction == "Left":
-            self.rect.x -= abs(self.xspeed)
+            vx = -abs(self.xspeed)
         elif self.direction == "Right":
 
             # Using absolute value fixes bug I had where it was adding a negative number making it think it was going
             # right but it was actually going left
-            self.rect.x += abs(self.xspeed)
+            vx = abs(self.xspeed)
+        else:
+            vx = 0
+        return vx, -self.yspeed
+
+    # Moves the ball one physics step without hitting anything but the walls,
+    # step_scale is the length of the step in 60ths of a second
+    def update(self, step_scale=1.0):
+        vx, vy = self.velocity()
+        self.move_to(self.pos_x + vx * step_scale, self.pos_y + vy * step_scale)
+
+    # Puts the ball where it ended up this step and bounces it off the walls
+    def move_to(self, x, y):
+        self.prev_x = self.pos_x
+        self.prev_y = self.pos_y
+        self.pos_x = x
+        self.pos_y = y
 
-        # handle wall hits and play sounds. Will stop already playing sound to stop overlay
-        if self.rect.right >= self.display_width:
-            self.wall_hit_sound.stop()
-            self.wall_hit_sound.play()
-            self.rect.right = self.display_width
+        # handle wall hits and play sounds
+        if self.pos_x + self.rect.width >= self.display_width:
+            Audio.play("wall_hit")
+            self.pos_x = self.display_width - self.rect.width
             self.bounce("Left")
 
-        if self.rect.left <= 0:
+        if self.pos_x <= 0:
             self.bounce("Right")
-            self.rect.x = 0
-            self.wall_hit_sound.stop()
-            self.wall_hit_sound.play()
+            self.pos_x = 0
+            Audio.play("wall_hit")
 
-        if self.rect.top <= 0:
-            self.wall_hit_sound.stop()
-            self.wall_hit_sound.play()
-            self.rect.top = 0
+        if self.pos_y <= 0:
+            Audio.play("wall_hit")
+            self.pos_y = 0
             self.bounce()
 
-    def draw(self, screen):
-        screen.blit(self.image, (self.rect.x, self.rect.y))
+        self.rect.x = round(self.pos_x)
+        self.rect.y = round(self.pos_y)
+
+    # interpolation is how far between the last two physics steps to draw the ball, 1 draws it where it is now
+    def draw(self, queue, interpolation=1.0):
+        x = self.prev_x + (self.pos_x - self.prev_x) * interpolation
+        y = self.prev_y + (self.pos_y - self.prev_y) * interpolation
+        queue.push(self.image, (round(x), round(y)), Render.SPRITES)
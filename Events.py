@@ -0,0 +1,100 @@
+import pygame
+
+import Collision
+
+# Events that are hit tested against widgets
+MOUSE_EVENTS = (pygame.MOUSEMOTION, pygame.MOUSEBUTTONDOWN, pygame.MOUSEBUTTONUP)
+
+
+# Sends a scene's events only to what wants them. Handlers subscribe to the event types they care about and get
+# (event, pressed_keys) like Scene.handle_input does.
+#
+# Widgets (like Gui.StandardButton) are kept in a UniformGrid by their rects. A mouse event only goes to the visible
+# widgets under the mouse, plus any widget still tracking the mouse (see StandardButton.tracking), so it can see the
+# mouse leave or a click finish outside it. Hidden widgets get nothing, as before. Widgets get their events after
+# the handlers, in the order they were added.
+class EventRouter(object):
+    def __init__(self, cell_size=100):
+        self.handlers = {}
+        self.grid = Collision.UniformGrid(cell_size, cell_size)
+        # what each widget does when it is clicked, and the order they were added in
+        self.on_click = {}
+        self.order = {}
+        # the rect each widget was put in the grid with
+        self.indexed = {}
+        self.tracking = {}
+
+    def subscribe(self, handler, *event_types):
+        for event_type in event_types:
+            self.handlers.setdefault(event_type, []).append(handler)
+
+    def unsubscribe(self, handler):
+        for handlers in self.handlers.values():
+            while handler in handlers:
+                handlers.remove(handler)
+
+    # on_click is called with no arguments when the widget is clicked
+    def add_widget(self, widget, on_click=None):
+        self.on_click[widget] = on_click
+        self.order[widget] = len(self.order)
+        self.indexed[widget] = pygame.Rect(widget.rect)
+        self.grid.insert(widget)
+
+    def remove_widget(self, widget):
+        self.grid.remove(widget)
+        self.on_click.pop(widget, None)
+        self.order.pop(widget, None)
+        self.indexed.pop(widget, None)
+        self.tracking.pop(widget, None)
+
+    # Call after moving or resizing a widget. Widgets that change their own rect while handling an event (like a
+    # ToggleButton resizing to fit its new label) are moved automatically.
+    def move_widget(self, widget):
+        if widget in self.indexed and widget.rect != self.indexed[widget]:
+            self.indexed[widget] = pygame.Rect(widget.rect)
+            self.grid.move(widget)
+
+    # Widgets that get a mouse event at pos, in the order they were added
+    def widgets_at(self, pos):
+        widgets = [widget for widget in self.grid.query_point(pos) if widget.rect.collidepoint(pos)]
+        if self.tracking:
+            widgets += [widget for widget in self.tracking if widget not in widgets]
+        widgets = [widget for widget in widgets if widget.visible]
+        if len(widgets) > 1:
+            widgets.sort(key=self.order.get)
+        return widgets
+
+    def dispatch(self, event, pressed_keys):
+        for handler in self.handlers.get(event.type, ()):
+            handler(event, pressed_keys)
+
+        if event.type not in MOUSE_EVENTS or not self.order:
+            return
+        for widget in self.widgets_at(event.pos):
+            if widget not in self.order:
+                # removed by something earlier in this event
+                continue
+            actions = widget.handle_event(event)
+            if widget.tracking():
+                self.tracking[widget] = None
+            else:
+                self.tracking.pop(widget, None)
+            self.move_widget(widget)
+            on_click = self.on_click.get(widget)
+            if 'click' in actions and on_click is not None:
+                on_click()
+
+
+# Merges every run of MOUSEMOTION events next to each other into one, at the last position and with all their
+# relative motion added up. Motion either side of a click or key press is kept apart so those still happen where the
+# mouse was at the time.
+def coalesce_motion(events):
+    coalesced = []
+    for event in events:
+        if event.type == pygame.MOUSEMOTION and coalesced and coalesced[-1].type == pygame.MOUSEMOTION:
+            last = coalesced[-1]
+            rel = (last.rel[0] + event.rel[0], last.rel[1] + event.rel[1])
+            coalesced[-1] = pygame.event.Event(pygame.MOUSEMOTION, dict(event.dict, rel=rel))
+        else:
+            coalesced.append(event)
+    return coalesced
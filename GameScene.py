@@ -1,25 +1,64 @@
 import random
+import sys
 
 import pygame
 
+import Assets
+import Audio
+import Collision
+import Display
 import Entities
+import Events
 import Gui
 import GuiScreens
-from Scene import Scene
+import Levels
+import Multiball
+import Render
+from Scene import Scene, ScenePreload
 
+# All the speeds in the game are in pixels per 60th of a second
+FRAME_MS = 1000 / 60
 
-class GameScene(Scene):
-    def __init__(self, start_time):
 
-        pygame.key.set_repeat()
-        # Stores 1 dimensional list of each block
-        self.block_list = []
-        self.width = pygame.display.Info().current_w
-        self.height = pygame.display.Info().current_h
+class GameScene(Scene):
+    supports_dirty_rendering = True
+
+    # Difficulty settings, all times are milliseconds of play. BatchSim.py changes these to try out other values.
+    speed_up_times = (60000, 120000)
+    gold_block_interval = 10000
+    # The ball launches with a random x speed between -launch_xspeed and launch_xspeed
+    launch_xspeed = 8.0
+
+    # size is the size of the play area. It defaults to the size the game is drawn at (see Display.py).
+    # multiball is how many extra balls to launch with the ball (needs numpy).
+    # Every random choice in a game comes from self.rng, so two games with the same seed and the same input play out
+    # exactly the same. Without a seed a random one is picked, and kept in self.seed so the game can be recorded.
+    # level is the number of the level file to start on, see Levels.py. Its blocks are loaded unless they are given,
+    # like by preload.
+    def __init__(self, start_time, size=None, multiball=0, seed=None, level=1, blocks=None):
+
+        if pygame.display.get_init():
+            pygame.key.set_repeat()
+        # Every block in the level. It is also what the ball is swept against, a block is found from its cell.
+        self.level = level
+        if blocks is None:
+            blocks = Levels.load_and_build(level)
+            if blocks is None:
+                raise Levels.LevelError("there is no level %d" % level)
+        self.blocks = blocks
+        # The next level is built on the loading thread while this one is played
+        self.next_blocks = Levels.load_async(level + 1)
+        # Pre-composited blocks for dirty rectangle rendering, built the first time it is needed
+        self.background = None
+        self.background_colour = (255, 255, 255)
+        self.background_changes = []
+        if size is None:
+            size = Display.size()
+        self.width, self.height = size
         self.start_time = start_time
-        self.font = pygame.font.Font("8bitfont.ttf", 25)
-        self.large_font = pygame.font.Font("8bitfont.ttf", 60)
-        self.game_over_text = pygame.image.load("images/gameover.png").convert_alpha()
+        self.seed = seed if seed is not None else random.getrandbits(64)
+        self.rng = random.Random(self.seed)
+        self.game_over_text = Assets.image("gameover", alpha=True)
         self.game_over_state = False
         self.victory_state = False
 
@@ -29,20 +68,28 @@ class GameScene(Scene):
         self.buttons['Leaderboards'] = Gui.StandardButton((400, 420, 60, 30), 'Add to leaderboards', center_x=True,
                                                           font_size=40)
         self.buttons['Leaderboards'].visible = False
-        # Draw all the blocks on the screen
-        self.draw_blocks()
 
         self.lives = 3
         self.score = 0
+        # over every level played
+        self.blocks_cleared = 0
 
         # Initialises the Paddle and ball classes ready to use in the game
-        self.paddle = Entities.Paddle()
-        self.ball = Entities.Ball(self.paddle.rect.x + self.paddle.rect.width / 2 - 10, self.paddle.rect.y - 20)
-
-        # Load audio
-        self.block_hit_sound = pygame.mixer.Sound("sounds/hit.wav")
-        self.game_over_sound = pygame.mixer.Sound("sounds/game_over.wav")
-        self.gametime = 0
+        self.paddle = Entities.Paddle((self.width, self.height))
+        # The red line the ball mustn't reach, three pixels high just under the top of the paddle
+        self.red_line = pygame.Surface((self.width + 1, 3))
+        self.red_line.fill((255, 200, 200))
+        self.ball = Entities.Ball(self.paddle.rect.x + self.paddle.rect.width / 2 - 10, self.paddle.rect.y - 20,
+                                  (self.width, self.height))
+
+        self.router = Events.EventRouter()
+        self.router.subscribe(self.paddle_input, pygame.MOUSEMOTION, pygame.KEYDOWN, pygame.KEYUP)
+        self.router.subscribe(self.launch_input, pygame.KEYDOWN, pygame.MOUSEBUTTONDOWN)
+        self.router.add_widget(self.buttons['Main Menu'], lambda: self.change_scene(GuiScreens.TitleScreen()))
+        self.router.add_widget(self.buttons['Leaderboards'], lambda: self.change_scene_when_ready(
+            GuiScreens.AddToLeaderboards.preload(), self.score))
+
+        self.gametime = start_time
         self.time_in_play_store = 0
         self.time_in_play = 0
         self.gold_block_exists = False
@@ -52,71 +99,68 @@ class GameScene(Scene):
         self.speed_up_1 = False
         self.speed_up_2 = False
 
+        # Extra balls for multiball mode, all moved together by a BallSystem
+        self.multiball = multiball
+        self.balls = None
+        if multiball:
+            self.balls = Multiball.BallSystem((self.width, self.height), capacity=multiball)
+            self.balls.set_blocks(self.blocks)
+
         # Is also a subclass of Scene so it needs to be initialized
         super().__init__()
 
-    def handle_input(self, event, pressed_keys):
+    # Gets a game ready on the scene loading thread: the blocks of its first level and its fonts.
+    # Make it with scene(start_time).
+    @classmethod
+    def preload(cls, size=None, multiball=0, seed=None, level=1):
+        def load():
+            Assets.font("8bitfont.ttf", 25)
+            Assets.font("8bitfont.ttf", 60)
+            Assets.font("Arial", 40)
+            blocks = Levels.load_and_build(level)
+            if blocks is None:
+                raise Levels.LevelError("there is no level %d" % level)
+            return blocks
+
+        return ScenePreload(load, lambda blocks, start_time: cls(start_time, size, multiball, seed, level, blocks))
+
+    def paddle_input(self, event, pressed_keys):
         if self.running or self.new_game:
             self.paddle.handle_input(event, pressed_keys)
+
+    def launch_input(self, event, pressed_keys):
         if self.new_game:
             if event.type == pygame.KEYDOWN:
                 if event.key == pygame.K_SPACE:
-                    # Launches ball at a random X velocity
-                    self.ball.xspeed = random.uniform(-self.ball.maxspeed, self.ball.maxspeed)
-                    self.new_game = False
-                    self.running = True
-                    self.start_time = self.gametime
+                    self.launch()
             elif event.type == pygame.MOUSEBUTTONDOWN:
                 if event.button == 1:
-                    self.ball.xspeed = random.uniform(-self.ball.maxspeed, self.ball.maxspeed)
-                    self.new_game = False
-                    self.running = True
-                    self.start_time = self.gametime
-        if 'click' in self.buttons['Main Menu'].handle_event(event):
-            self.change_scene(GuiScreens.TitleScreen())
-        if 'click' in self.buttons['Leaderboards'].handle_event(event):
-            self.change_scene(GuiScreens.AddToLeaderboards(self.score))
-
-    def draw_blocks(self):
-        colour_list = ["red", "yellow", "green", "blue", "purple"]
-        y_coord = 40
-        start_x = 10
-        for colour in colour_list:
-            for i in range(0, 12):
-                self.block_list.append(Entities.Block(start_x + 65 * i, y_coord, colour))
-            y_coord += 20
-            for i in range(0, 12):
-                self.block_list.append(Entities.Block(start_x + 65 * i, y_coord, colour))
-            y_coord += 20
+                    self.launch()
+
+    # Launches ball at a random X velocity, along with the extra balls in multiball mode
+    def launch(self):
+        self.ball.xspeed = self.rng.uniform(-self.launch_xspeed, self.launch_xspeed)
+        self.new_game = False
+        self.running = True
+        self.start_time = self.gametime
 
+        if self.balls is not None:
+            x, y = self.ball.rect.center
+            for i in range(self.multiball):
+                self.balls.spawn(x, y, self.rng.uniform(-self.launch_xspeed, self.launch_xspeed), -abs(self.ball.yspeed))
+
+    # Called once per physics step. The ball and paddle move by however much time has passed since the last step.
     def update(self, gametime):
+        step_scale = max(0, gametime - self.gametime) / FRAME_MS
         self.gametime = gametime
+        self.paddle.update(step_scale)
         if not self.running and self.new_game:
             self.ball.launch_mode(self.paddle)
 
-        # Collision detection
+        # Ball in play
         elif self.running and not self.new_game:
-            for block in self.block_list:
-                if pygame.sprite.collide_rect(self.ball, block):
-                    # So I've checked that they collide. But I need to check which side of the block they hit
-                    # If they hit the left, they don't need to change the Y direction, just the X.
-                    if self.ball.rect.right >= block.rect.left and self.ball.rect.centerx < block.rect.left and ((self.ball.rect.top > block.rect.top and self.ball.rect.top < block.rect.bottom) or (self.ball.rect.bottom > block.rect.top and self.ball.rect.bottom < block.rect.bottom)):
-                        self.ball.bounce("Left")
-                    elif self.ball.rect.left <= block.rect.right and self.ball.rect.centerx > block.rect.right and ((self.ball.rect.top > block.rect.top and self.ball.rect.top < block.rect.bottom) or (self.ball.rect.bottom > block.rect.top and self.ball.rect.bottom < block.rect.bottom)):
-                        self.ball.bounce("Right")
-                    else:
-                        self.ball.bounce()
-                    self.block_hit(block)
-
-                    # Collision isn't perfect but stopped the glitch which happened before.
-
-            if pygame.sprite.collide_rect(self.ball, self.paddle):
-                # distance from the center of the paddle
-                dist = self.ball.rect.centerx - self.paddle.rect.centerx
-                # Bounces at an angle depending on how far away it is from the center of the paddle.
-                self.ball.bounce(dist)
-
-            if self.ball.rect.bottom > self.paddle.rect.top and (
+            # Lost a life if the ball got past the paddle
+            if self.ball.rect.top > self.paddle.rect.bottom or self.ball.rect.bottom > self.paddle.rect.top and (
                             self.ball.rect.right < self.paddle.rect.left or self.ball.rect.left > self.paddle.rect.right):
                 self.game_over()
 
@@ -131,86 +175,214 @@ class GameScene(Scene):
             self.check_speed_up(gametime)
 
             # Update position of the ball
-            self.ball.update()
+            self.move_ball(step_scale)
+
+        # The extra balls keep going until they fall off the bottom, even when the main ball is waiting to launch
+        if self.balls is not None and not self.game_over_state and not self.victory_state:
+            for block in self.balls.update(step_scale, self.paddle.rect):
+                self.block_hit(block)
+
+        # Only once everything has moved, so nothing in this step can hit a block of the next level
+        if len(self.blocks) == 0 and not self.victory_state:
+            self.next_level()
 
         self.generate_gold_block(gametime)
 
+    # Moves the ball for this step. The ball is swept along its whole path, so it can't skip through a block however
+    # fast it goes, and it bounces off everything in its way in the order it gets there.
+    def move_ball(self, step_scale):
+        vx, vy = self.ball.velocity()
+        x, y, hits = Collision.sweep_box(self.ball.pos_x, self.ball.pos_y, self.ball.rect.width, self.ball.rect.height,
+                                         (vx * step_scale, vy * step_scale), self.blocks, [self.paddle],
+                                         respond=lambda impacts, x, y: self.ball_impact(impacts, x, step_scale),
+                                         can_hit=self.ball_can_hit)
+        self.ball.move_to(x, y)
+
+        # The blocks are only removed once the ball has finished moving
+        for time, item, normal in hits:
+            if item is not self.paddle:
+                self.block_hit(item)
+
+    # The ball goes straight through the paddle from underneath or the side, it can only be hit from above
+    def ball_can_hit(self, item, normal):
+        return item is not self.paddle or normal[1] < 0
+
+    # Bounces the ball off whatever it just hit and returns its velocity for the rest of the step.
+    # If it hits more than one block at once (like on the line between two) it still only bounces once.
+    def ball_impact(self, impacts, x, step_scale):
+        side = 0
+        top_or_bottom = False
+        paddle_hit = False
+        for item, normal in impacts:
+            if item is self.paddle:
+                # distance from the center of the paddle
+                dist = x + self.ball.rect.width / 2 - self.paddle.rect.centerx
+                # Bounces at an angle depending on how far away it is from the center of the paddle.
+                self.ball.bounce(dist)
+                paddle_hit = True
+            else:
+                side = normal[0] or side
+                top_or_bottom = top_or_bottom or normal[1] != 0
+
+        # If they hit the left of a block, they don't need to change the Y direction, just the X.
+        if side < 0:
+            self.ball.bounce("Left")
+        elif side > 0:
+            self.ball.bounce("Right")
+        if top_or_bottom and not paddle_hit:
+            self.ball.bounce()
+
+        vx, vy = self.ball.velocity()
+        return vx * step_scale, vy * step_scale
+
     # checks the game time, after 1 minute the game speeds up, after 2 minutes it speeds up again.
     def check_speed_up(self, gametime):
-        if self.time_in_play > 60000 and not self.speed_up_1:
+        if self.time_in_play > self.speed_up_times[0] and not self.speed_up_1:
             if self.ball.yspeed < 0:
                 self.ball.yspeed = -6
             else:
                 self.ball.yspeed = 6
             self.speed_up_1 = True
-        if self.time_in_play > 120000 and not self.speed_up_2:
+        if self.time_in_play > self.speed_up_times[1] and not self.speed_up_2:
             if self.ball.yspeed < 0:
                 self.ball.yspeed = -8
             else:
                 self.ball.yspeed = 8
             self.speed_up_2 = True
 
+    # block is the index of the block in self.blocks
     def block_hit(self, block):
 
-        self.block_hit_sound.stop()
-        self.block_hit_sound.play()
+        Audio.play("hit")
 
         # Scores for each block are added
-        if block.colour == "purple":
-            self.score += 10
-        elif block.colour == "blue":
-            self.score += 20
-        elif block.colour == "green":
-            self.score += 30
-        elif block.colour == "yellow":
-            self.score += 40
-        elif block.colour == "red":
-            self.score += 50
-        elif block.colour == "gold":
-            self.score += 100
-
-        self.block_list.remove(block)
-
-        if len(self.block_list) == 0:
-            self.victory()
+        self.score += self.blocks.score(block)
+
+        rect = self.blocks.rect(block)
+        self.blocks.destroy(block)
+        self.blocks_cleared += 1
+        # erase the block from the background once, instead of redrawing every block every frame
+        self.redraw_background(rect)
 
     # generate a gold block after 10 seconds.
     def generate_gold_block(self, gametime):
         if self.running and not self.new_game:
-            if self.time_in_play > 10000:
+            if self.time_in_play > self.gold_block_interval:
                 if not self.gold_block_exists:
                     self.time_store = self.time_in_play
-                    self.current_gold_block = random.choice(self.block_list)
+                    self.current_gold_block = self.rng.choice(self.blocks.live())
                     self.gold_block_exists = True
-                    self.current_gold_block.make_gold()
-                elif self.gold_block_exists and self.time_in_play > self.time_store + 10000:
+                    self.make_gold(self.current_gold_block)
+                elif self.gold_block_exists and self.time_in_play > self.time_store + self.gold_block_interval:
                     self.time_store = gametime
-                    self.current_gold_block.ungold()
-                    self.current_gold_block = random.choice(self.block_list)
-                    self.current_gold_block.make_gold()
+                    self.ungold(self.current_gold_block)
+                    self.current_gold_block = self.rng.choice(self.blocks.live())
+                    self.make_gold(self.current_gold_block)
+
+    # The gold block is bigger than the others, so the background has to be redrawn over both rects
+    def make_gold(self, block):
+        old_rect = self.blocks.rect(block)
+        self.blocks.make_gold(block)
+        self.redraw_background(old_rect.union(self.blocks.rect(block)))
+
+    # The gold block may have been hit since it turned gold, then there is nothing left to change back
+    def ungold(self, block):
+        old_rect = self.blocks.rect(block)
+        if self.blocks.gold == block:
+            self.blocks.ungold()
+        self.redraw_background(old_rect.union(self.blocks.rect(block)))
 
     def game_over(self):
         if self.lives == 0:
             self.running = False
             self.game_over_state = True
-            self.game_over_sound.play()
+            Audio.play("game_over")
         else:
             self.lives -= 1
             self.running = False
             self.new_game = True
 
+    # Swaps in the next level, which has usually finished loading long before, and puts the ball back on the paddle.
+    # The game is won when there are no more levels.
+    # A next level that can't be loaded ends the game as a win, like running out of levels, rather than crashing it
+    def next_level(self):
+        try:
+            blocks = self.next_blocks.result()
+        except (OSError, Levels.LevelError) as e:
+            print("GameScene: can't load level %d: %s" % (self.level + 1, e), file=sys.stderr)
+            blocks = None
+        if blocks is None:
+            self.victory()
+            return
+        self.level += 1
+        self.blocks = blocks
+        self.next_blocks = Levels.load_async(self.level + 1)
+        if self.balls is not None:
+            self.balls.set_blocks(blocks)
+        # the gold block went with the last level
+        self.gold_block_exists = False
+        self.running = False
+        self.new_game = True
+        self.rebuild_background()
+
     def victory(self):
         self.running = False
         self.victory_state = True
 
+    # Full redraw, used when dirty rendering is switched off
     def render(self, screen):
-
-        # Iterate through list and draw each block
-        for block in self.block_list:
-            block.draw(screen)
-
-        score_text = self.font.render("Score: " + str(self.score), 0, (0, 0, 0))
-        lives_text = self.font.render("Lives: " + str(self.lives), 0, (0, 0, 0))
+        queue = self.render_queue
+        self.draw_background(queue)
+        self.draw_dynamic(queue)
+        queue.submit(screen)
+
+    # The blocks and the red line
+    def draw_background(self, queue):
+        self.blocks.draw(queue)
+        queue.push(self.red_line, (0, self.paddle.rect.top), Render.BACKGROUND)
+
+    # The blocks and the red line only change when a block is hit or turns gold, so they are composited once
+    # onto a background surface. BasicGame restores the areas the moving things covered from this surface.
+    def render_background(self, screen, colour):
+        if self.background is None:
+            self.background_colour = colour
+            self.background = pygame.Surface(screen.get_size()).convert()
+            self.rebuild_background()
+            self.background_changes = []
+        return self.background
+
+    # Draws the whole background again, like when the level changes
+    def rebuild_background(self):
+        if self.background is None:
+            return
+        self.background.fill(self.background_colour)
+        self.draw_background(self.render_queue)
+        self.render_queue.submit(self.background)
+        self.background_changes.append(self.background.get_rect())
+
+    # Redraws an area of the background after the blocks in it changed, and remembers it so it gets presented
+    def redraw_background(self, rect):
+        if self.background is None:
+            return
+        self.background.fill(self.background_colour, rect)
+        self.blocks.draw_area(self.render_queue, rect)
+        self.render_queue.submit(self.background)
+        self.background_changes.append(rect)
+
+    # Returns the areas of the background that changed since the last call
+    def take_background_changes(self):
+        changes = self.background_changes
+        self.background_changes = []
+        return changes
+
+    # Draws everything that isn't part of the background and returns the rects that were drawn on
+    def render_dynamic(self, screen):
+        self.draw_dynamic(self.render_queue)
+        return self.render_queue.submit(screen)
+
+    def draw_dynamic(self, queue):
+        score_text = Assets.text("8bitfont.ttf", 25, "Score: " + str(self.score), (0, 0, 0), False)
+        lives_text = Assets.text("8bitfont.ttf", 25, "Lives: " + str(self.lives), (0, 0, 0), False)
         if self.speed_up_1 and self.speed_up_2:
             speed = 3
         elif self.speed_up_1:
@@ -218,28 +390,29 @@ class GameScene(Scene):
         else:
             speed = 1
 
-        speed_text = self.font.render("Speed Level: " + str(speed), 0, (0, 0, 0))
-        screen.blit(score_text, (20, 10))
-        screen.blit(speed_text, (300, 10))
-        screen.blit(lives_text, (700, 10))
+        speed_text = Assets.text("8bitfont.ttf", 25, "Speed Level: " + str(speed), (0, 0, 0), False)
+        queue.push(score_text, (20, 10))
+        queue.push(speed_text, (300, 10))
+        queue.push(lives_text, (700, 10))
 
         for k, v in self.buttons.items():
-            v.draw(screen)
+            v.draw(queue)
 
         if self.game_over_state:
-            screen.blit(self.game_over_text, (self.width / 2 - self.game_over_text.get_width() / 2, 100))
-            final_score = self.font.render("Your score: " + str(self.score), 0, (0, 0, 0))
-            screen.blit(final_score, (self.width / 2 - final_score.get_width() / 2, 280))
+            queue.push(self.game_over_text, (self.width / 2 - self.game_over_text.get_width() / 2, 100))
+            final_score = Assets.text("8bitfont.ttf", 25, "Your score: " + str(self.score), (0, 0, 0), False)
+            queue.push(final_score, (self.width / 2 - final_score.get_width() / 2, 280))
             self.buttons['Main Menu'].visible = True
             self.buttons['Leaderboards'].visible = True
 
         if self.victory_state:
-            victory_text = self.large_font.render("You win!", 0, (0, 0, 0))
-            screen.blit(victory_text, (self.width / 2 - victory_text.get_width() / 2, 150))
-            final_score = self.font.render("Your score: " + str(self.score), 0, (0, 0, 0))
-            screen.blit(final_score, (self.width / 2 - final_score.get_width() / 2, 280))
+            victory_text = Assets.text("8bitfont.ttf", 60, "You win!", (0, 0, 0), False)
+            queue.push(victory_text, (self.width / 2 - victory_text.get_width() / 2, 150))
+            final_score = Assets.text("8bitfont.ttf", 25, "Your score: " + str(self.score), (0, 0, 0), False)
+            queue.push(final_score, (self.width / 2 - final_score.get_width() / 2, 280))
             self.buttons['Main Menu'].visible = True
             self.buttons['Leaderboards'].visible = True
-        pygame.draw.line(screen, (255,200,200), (0,self.paddle.rect.top + 1), (self.width, self.paddle.rect.top + 1), 3)
-        self.paddle.draw(screen)
-        self.ball.draw(screen)
+        self.paddle.draw(queue)
+        self.ball.draw(queue, self.interpolation)
+        if self.balls is not None:
+            self.balls.draw(queue, self.interpolation)
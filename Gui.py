@@ -1,6 +1,10 @@
+from collections import OrderedDict
+
 import pygame
 from pygame.locals import *
 
+import Assets
+
 pygame.font.init()
 
 BLACK = (0, 0, 0)
@@ -9,6 +13,50 @@ DARKGREY = (64, 64, 64)
 GREY = (128, 128, 128)
 LIGHTGREY = (212, 208, 200)
 
+# Painted button surfaces, shared by every button that looks the same. Buttons are made again every time a scene is,
+# so the title screen's buttons are only painted the first time it is shown. Least recently used first.
+BUTTON_CACHE_SIZE = 64
+button_cache = OrderedDict()
+
+
+# Returns the (normal, down, highlight) surfaces of a button of size showing text. They are shared, so they must
+# never be drawn on.
+def button_surfaces(text, size, bgcolour, fgcolour, hcolour, font):
+    key = (text, tuple(size), bgcolour, fgcolour, hcolour, font)
+    surfaces = button_cache.get(key)
+    if surfaces is not None:
+        button_cache.move_to_end(key)
+        return surfaces
+
+    surface_normal = pygame.Surface(size)
+    surface_down = pygame.Surface(size)
+    surface_highlight = pygame.Surface(size)
+
+    # Fill background colour
+    surface_normal.fill(bgcolour)
+    surface_down.fill(bgcolour)
+    surface_highlight.fill(hcolour)
+
+    # puts text on each button surface
+    label_surface = font.render(text, True, fgcolour)
+    labelrect = label_surface.get_rect()
+    w, h = size
+    labelrect.center = int(w / 2), int(h / 2)
+    surface_normal.blit(label_surface, labelrect)
+    surface_down.blit(label_surface, labelrect)
+    surface_highlight.blit(label_surface, labelrect)
+
+    # button borders
+    pygame.draw.rect(surface_down, BLACK, pygame.Rect((0, 0, w, h)), 3)  # thick border on click
+    pygame.draw.rect(surface_normal, BLACK, pygame.Rect((0, 0, w, h)), 1)  # thin border for normal
+    pygame.draw.rect(surface_highlight, BLACK, pygame.Rect((0, 0, w, h)), 1)  # thin border for hover
+
+    surfaces = (surface_normal, surface_down, surface_highlight)
+    button_cache[key] = surfaces
+    if len(button_cache) > BUTTON_CACHE_SIZE:
+        button_cache.popitem(last=False)
+    return surfaces
+
 
 class StandardButton(object):
     # Create all the attributes
@@ -31,7 +79,7 @@ class StandardButton(object):
 
         # If font not specified then use default
         if font is None:
-            self.font = pygame.font.SysFont("Arial", font_size)
+            self.font = Assets.font("Arial", font_size)
         else:
             self.font = font
 
@@ -41,10 +89,8 @@ class StandardButton(object):
         self.last_click_on_button = False
         self.visible = True
 
-        # Create button surfaces for all states
-        self.surface_normal = pygame.Surface(self.rect.size)
-        self.surface_down = pygame.Surface(self.rect.size)
-        self.surface_highlight = pygame.Surface(self.rect.size)
+        # Button surfaces for all states, from the shared cache
+        self.surface_normal = self.surface_down = self.surface_highlight = None
 
         # Draw the initial button
         self.update()
@@ -107,58 +153,50 @@ class StandardButton(object):
         # returns a list of actions performed in the last frame. e.g click, up, exit, down
         return ret_val
 
-    def draw(self, screen):
+    # True while the button needs mouse events from outside its rect: to see the mouse leave it,
+    # or to see a click that started on it finish
+    def tracking(self):
+        return self.mouse_over or self.button_down or self.last_click_on_button
+
+    # Pushes the button onto a Render.RenderQueue, unless it is hidden
+    def draw(self, queue):
         if self.visible:
             if self.button_down:
-                screen.blit(self.surface_down, self.rect)
+                queue.push(self.surface_down, self.rect)
             elif self.mouse_over:
-                screen.blit(self.surface_highlight, self.rect)
+                queue.push(self.surface_highlight, self.rect)
             else:
-                screen.blit(self.surface_normal, self.rect)
+                queue.push(self.surface_normal, self.rect)
 
     def update(self):
 
-        # Fill background colour
-        self.surface_normal.fill(self.bgcolour)
-        self.surface_down.fill(self.bgcolour)
-        self.surface_highlight.fill(self.hcolour)
-
-        # Draw text
-        label_surface = self.font.render(self.label, True, self.fgcolour)
-        labelrect = label_surface.get_rect()
-
         # Will automatically resize the button when the label is changed if needed
         # Also automatically re-centers the button to where it was before the label change
         # so it means I don't have to do it manually.
         if self.center_x:
             self.rect.x = self.rect.x - self.rect.width / 2
 
+        self.paint(self.label)
+
+    # Resizes the button to fit text if it needs to and takes the surfaces for it from the cache. The text is only
+    # measured here, it is only rendered if no button like this one has been painted yet.
+    def paint(self, text):
+        label_width, label_height = self.font.size(text)
+
         if self.auto_resize:
-            if labelrect.width >= self.rect.width - 50:
+            if label_width >= self.rect.width - 50:
                 center_pos = self.rect.center
 
-                self.change_size(labelrect.width + 50, self.rect.height, False)  # False stops it updating
+                self.change_size(label_width + 50, self.rect.height, False)  # False stops it updating
                 self.change_pos(center_pos[0] - self.rect.width / 2, center_pos[1] - self.rect.height / 2, False)
 
-                self.change_size(self.rect.width, labelrect.height + 5, False)
+                self.change_size(self.rect.width, label_height + 5, False)
 
                 # If I don't stop them updating then it just becomes a huge loop which never ends and eventually
                 # breaks the program
 
-        w = self.rect.width
-        h = self.rect.height
-
-        labelrect.center = int(w / 2), int(h / 2)
-
-        # puts text on each button surface
-        self.surface_normal.blit(label_surface, labelrect)
-        self.surface_down.blit(label_surface, labelrect)
-        self.surface_highlight.blit(label_surface, labelrect)
-
-        # button borders
-        pygame.draw.rect(self.surface_down, BLACK, pygame.Rect((0, 0, w, h)), 3)  # thick border on click
-        pygame.draw.rect(self.surface_normal, BLACK, pygame.Rect((0, 0, w, h)), 1)  # thin border for normal
-        pygame.draw.rect(self.surface_highlight, BLACK, pygame.Rect((0, 0, w, h)), 1)  # thin border for hover
+        self.surface_normal, self.surface_down, self.surface_highlight = button_surfaces(
+            text, self.rect.size, self.bgcolour, self.fgcolour, self.hcolour, self.font)
 
     # This is useful if a button needs its label changing
     def set_label(self, label):
@@ -166,12 +204,10 @@ class StandardButton(object):
         self.update()
         return self.label
 
-    # I can change the size of the button and decide whether to update the button
+    # I can change the size of the button and decide whether to update the button.
+    # The surfaces only match the new size once it has been updated.
     def change_size(self, w, h, update=True):
         self.rect.size = (w, h)
-        self.surface_normal = pygame.transform.scale(self.surface_normal, (w, h))
-        self.surface_down = pygame.transform.scale(self.surface_down, (w, h))
-        self.surface_highlight = pygame.transform.scale(self.surface_highlight, (w, h))
 
         if update:
             self.update()
@@ -219,23 +255,14 @@ class ToggleButton(StandardButton):
 
         super().__init__(rect, label, bgcolour, fgcolour, hcolour, font, auto_resize, center_x, font_size)
 
-    # Overrides StandardButton
+    # Overrides StandardButton. Flipping the state switches between the cached surfaces of the two labels.
     def update(self):
 
-        # Fill background colour
-        self.surface_normal.fill(self.bgcolour)
-        self.surface_down.fill(self.bgcolour)
-        self.surface_highlight.fill(self.hcolour)
-
         if self.state == True:
             self.state_text = self.state_1
         else:
             self.state_text = self.state_2
 
-        # Draw text
-        label_surface = self.font.render(self.label + ": " + str(self.state_text), True, self.fgcolour)
-        labelrect = label_surface.get_rect()
-
         # Will automatically resize the button when the label is changed if needed
         # Also automatically re-centers the button to where it was before the label change
         # so it means I don't have to do it.
@@ -243,32 +270,7 @@ class ToggleButton(StandardButton):
         if self.center_x:
             self.rect.centerx = self.orig_x
 
-        if self.auto_resize:
-            if labelrect.width >= self.rect.width - 50:
-                center_pos = self.rect.center
-
-                self.change_size(labelrect.width + 50, self.rect.height, False)  # False stops it updating
-                self.change_pos(center_pos[0] - self.rect.width / 2, center_pos[1] - self.rect.height / 2, False)
-
-                self.change_size(self.rect.width, labelrect.height + 5, False)
-
-                # If I don't stop them updating then it just becomes a huge loop which never ends and eventually
-                # breaks the program
-
-        w = self.rect.width
-        h = self.rect.height
-
-        labelrect.center = int(w / 2), int(h / 2)
-
-        # puts text on each button surface
-        self.surface_normal.blit(label_surface, labelrect)
-        self.surface_down.blit(label_surface, labelrect)
-        self.surface_highlight.blit(label_surface, labelrect)
-
-        # button borders
-        pygame.draw.rect(self.surface_down, BLACK, pygame.Rect((0, 0, w, h)), 3)  # thick border on click
-        pygame.draw.rect(self.surface_normal, BLACK, pygame.Rect((0, 0, w, h)), 1)  # thin border for normal
-        pygame.draw.rect(self.surface_highlight, BLACK, pygame.Rect((0, 0, w, h)), 1)  # thin border for hover
+        self.paint(self.label + ": " + str(self.state_text))
 
     def mouse_click(self, event):
         if self.state:
@@ -284,38 +286,52 @@ class ToggleButton(StandardButton):
 # This is a leaderboards box, but it is also capable of displaying any list in a scrollable table
 # However, it is only used for the leaderboards.
 
-# Works by drawing a surface(1) onto a surface(2), this clips the surface(1) by the dimensions of surface(2)
-# Then it just scrolls by offsetting the x coordinates
+# The table is virtualized: only the rows that are inside the box are drawn, straight onto a surface the size of the
+# box, so drawing costs the same with 10 scores or 100,000. Each row is rendered once and kept in a small cache.
+# Scrolling works by offsetting the rows by scroll_y pixels, and the scrollbar position is worked out from scroll_y.
 class LeaderboardsBox(object):
-    def __init__(self, x, y, width, height):
+    def __init__(self, x, y, width, height, max_cached_rows=64):
         self.rect = pygame.Rect(x, y, width, height)
         self.box_surface = pygame.Surface(self.rect.size)
         self.container_surface = pygame.Surface((self.rect.width - 36, self.rect.height - 6))
         self.cell_data = []
         self.cell_height = 80
         self.cell_padding = 1
-        self.table_rect = pygame.Rect(0, 0, self.rect.width - 36, 0)
-        self.table_surface = pygame.Surface(self.table_rect.size)
+        self.row_width = self.rect.width - 36
         self.scrollbar_rect = pygame.Rect(self.container_surface.get_width() + 10, 0, 20, 50)
         self.scrollbar_surface = pygame.Surface(self.scrollbar_rect.size)
-        self.font = pygame.font.SysFont("Arial", 35)
+        self.font = Assets.font("Arial", 35)
         self.mouse_down = False
         self.initial_click = (0, 0)
         self.y_diff = 0
         self.scrollbar_max_travel = self.rect.h - self.scrollbar_rect.height
-        self.scrollbar_pos = self.scrollbar_rect.centery - self.scrollbar_rect.height / 2
-        self.scrollbar_percent_travelled = self.scrollbar_pos / self.scrollbar_max_travel * 100
+        self.scroll_y = 0
+        self.max_cached_rows = max_cached_rows
+        self.row_cache = OrderedDict()
 
         self.update()
 
-    # This makes sure that the table is always the right size after any changes
-    # because the table can be edited in real time
-    # If these measurements weren't updated, some data wouldn't show.
+    # Total height of all the rows, even though they are never all drawn
+    def table_height(self):
+        return (self.cell_height + self.cell_padding) * len(self.cell_data)
+
+    def max_scroll(self):
+        return max(0, self.table_height() - self.container_surface.get_height())
+
+    # This makes sure that the scroll position is still inside the table after any changes
+    # because the table can be edited in real time. The cached rows may be out of date, so they are dropped.
     def update_measurements(self):
-        self.table_rect = pygame.Rect(0, 0, self.rect.width - 36, (self.cell_height + self.cell_padding) * len(self.cell_data))
-        if self.table_rect.h < self.container_surface.get_height():
-            self.table_rect.h = self.container_surface.get_height()
-        self.table_surface = pygame.Surface(self.table_rect.size)
+        self.row_cache.clear()
+        self.scroll_to(self.scroll_y)
+
+    # Scrolls so the top of the box is scroll_y pixels into the table and moves the scrollbar to match
+    def scroll_to(self, scroll_y):
+        max_scroll = self.max_scroll()
+        self.scroll_y = int(min(max(0, scroll_y), max_scroll))
+        if max_scroll > 0:
+            self.scrollbar_rect.y = round(self.scroll_y / max_scroll * self.scrollbar_max_travel)
+        else:
+            self.scrollbar_rect.y = 0
 
     def handle_input(self, event):
         if event.type == pygame.MOUSEBUTTONDOWN and event.button == 1 and not self.mouse_down:
@@ -335,15 +351,9 @@ class LeaderboardsBox(object):
             self.mouse_down = False
 
         if event.type == pygame.MOUSEMOTION and self.mouse_down:
-            self.scrollbar_rect.y = event.pos[1] - self.rect.y - self.y_diff
-            if self.scrollbar_rect.y < 0:
-                self.scrollbar_rect.y = 0
-            if self.scrollbar_rect.bottom > self.box_surface.get_height():
-                self.scrollbar_rect.bottom = self.box_surface.get_height()
-            self.scrollbar_pos = self.scrollbar_rect.centery - self.scrollbar_rect.height / 2
-            self.scrollbar_percent_travelled = self.scrollbar_pos / self.scrollbar_max_travel * 100
-
-            self.table_rect.y = -((self.table_rect.h - self.container_surface.get_height()) * self.scrollbar_percent_travelled) / 100
+            scrollbar_y = event.pos[1] - self.rect.y - self.y_diff
+            scrollbar_y = min(max(0, scrollbar_y), self.scrollbar_max_travel)
+            self.scroll_to(self.max_scroll() * scrollbar_y / self.scrollbar_max_travel)
 
     def add_cell_data(self, list):
         self.cell_data = list
@@ -357,34 +367,49 @@ class LeaderboardsBox(object):
 
     def remove_item(self, index):
         self.cell_data.pop(index)
+        self.update_measurements()
 
     def update(self):
         self.box_surface.fill((255, 255, 255))
-        self.container_surface.fill((0, 255, 0))
-        self.table_surface.fill((255, 255, 255))
         self.scrollbar_surface.fill((0, 0, 180))
         pygame.draw.rect(self.box_surface, BLACK, pygame.Rect((0, 0, self.rect.w, self.rect.h)), 3)
 
-    def draw(self, screen):
-        # This draws the data, it could be improved by having each cell as a new surface but this works fine.
-        y = 0
-        id_num = 1
-        for i in self.cell_data:
-            pygame.draw.rect(self.table_surface, BLACK, pygame.Rect((0, y, self.table_rect.w, self.cell_height)), 1)
-            id = self.font.render(str(id_num), 1, (0, 0, 0))
-            pygame.draw.line(self.table_surface, (0, 0, 0), (id.get_width() + 30, y),
-                             (id.get_width() + 30, y + self.cell_height - 1), 3)
-            name = self.font.render("Player: " + i['name'], 1, (0, 0, 0))
-            score = self.font.render("Score: " + str(i['score']), 1, (0, 0, 0))
-            self.table_surface.blit(id, (10, y + id.get_height() / 2))
-            self.table_surface.blit(name, (id.get_width() + 50, y + name.get_height() / 2))
-            self.table_surface.blit(score, (name.get_width() + 100, y + score.get_height() / 2))
-            y += (self.cell_height + self.cell_padding)
-            id_num += 1
+    # Renders one row of the table, or gets it from the cache if it was drawn recently
+    def row_surface(self, index):
+        surface = self.row_cache.get(index)
+        if surface is not None:
+            self.row_cache.move_to_end(index)
+            return surface
+
+        item = self.cell_data[index]
+        surface = pygame.Surface((self.row_width, self.cell_height))
+        surface.fill((255, 255, 255))
+        pygame.draw.rect(surface, BLACK, pygame.Rect((0, 0, self.row_width, self.cell_height)), 1)
+        id = self.font.render(str(index + 1), 1, (0, 0, 0))
+        pygame.draw.line(surface, (0, 0, 0), (id.get_width() + 30, 0), (id.get_width() + 30, self.cell_height - 1), 3)
+        name = self.font.render("Player: " + item['name'], 1, (0, 0, 0))
+        score = self.font.render("Score: " + str(item['score']), 1, (0, 0, 0))
+        surface.blit(id, (10, id.get_height() / 2))
+        surface.blit(name, (id.get_width() + 50, name.get_height() / 2))
+        surface.blit(score, (name.get_width() + 100, score.get_height() / 2))
+
+        self.row_cache[index] = surface
+        if len(self.row_cache) > self.max_cached_rows:
+            self.row_cache.popitem(last=False)
+        return surface
+
+    def draw(self, queue):
+        # Only the rows between the top and the bottom of the box are drawn
+        self.container_surface.fill((255, 255, 255))
+        row_height = self.cell_height + self.cell_padding
+        first = int(self.scroll_y // row_height)
+        last = min(len(self.cell_data), int((self.scroll_y + self.container_surface.get_height()) // row_height) + 1)
+        for index in range(first, last):
+            self.container_surface.blit(self.row_surface(index), (0, index * row_height - self.scroll_y))
+
         self.box_surface.blit(self.scrollbar_surface, self.scrollbar_rect)
-        self.container_surface.blit(self.table_surface, self.table_rect)
-        screen.blit(self.box_surface, self.rect)
-        screen.blit(self.container_surface, (self.rect.x + 3, self.rect.y + 3))
+        queue.push(self.box_surface, self.rect)
+        queue.push(self.container_surface, (self.rect.x + 3, self.rect.y + 3))
 
 
 # A simple text box object for text input
@@ -399,7 +424,6 @@ class TextBox(object):
         self.in_focus = False
         self.enter_action = enter_action
         self.string = ""
-        self.font = pygame.font.SysFont('Arial', 30)
         self.text = None
         self.text_x_offset = -5
         self.update()
@@ -440,8 +464,8 @@ class TextBox(object):
             colour = (0, 0, 0)
         pygame.draw.rect(self.box_surface, colour, pygame.Rect((0, 0, self.rect.w, self.rect.h)), 3)
 
-    def draw(self, screen):
+    def draw(self, queue):
 
-        self.text = self.font.render(self.string, 0, (0, 0, 0))
+        self.text = Assets.text("Arial", 30, self.string, (0, 0, 0), False)
         self.box_surface.blit(self.text, (self.text_x_offset, 5))
-        screen.blit(self.box_surface, (self.rect.x, self.rect.y))
+        queue.push(self.box_surface, (self.rect.x, self.rect.y))
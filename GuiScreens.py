@@ -1,13 +1,12 @@
-import operator
-import pickle
-import sys
-
 import pygame
 
+import Assets
 import BasicGame
+import Events
 import Gui
+import ScoreStore
 from GameScene import GameScene
-from Scene import Scene
+from Scene import Scene, ScenePreload
 
 
 class TitleScreen(Scene):
@@ -26,127 +25,148 @@ class TitleScreen(Scene):
             self.buttons['Controls'].state = False
         self.buttons['Quit'] = Gui.StandardButton((400, 460, 60, 30), 'Quit', center_x=True, font_size=40)
 
-        self.logo_image = pygame.image.load("images/logo.png").convert_alpha()
+        self.logo_image = Assets.image("logo", alpha=True)
+
+        # Got ready while the title is shown, so clicking a button never has to wait for them
+        self.help = HelpScreen.preload()
+        self.leaderboards = LeaderboardsScreen.preload()
+
+        # Each button calls its function when it is clicked
+        self.router = Events.EventRouter()
+        self.router.add_widget(self.buttons['Play'], lambda: self.change_scene_when_ready(self.help))
+        self.router.add_widget(self.buttons['Leaderboard'], lambda: self.change_scene_when_ready(self.leaderboards))
+        self.router.add_widget(self.buttons['Controls'], self.controls_click)
+        self.router.add_widget(self.buttons['Quit'], self.quit)
 
         # Calls the initializer method in the Scene class because it is a subclass
         super().__init__()
 
-    def handle_input(self, event, pressed_keys):
+    def controls_click(self):
+        BasicGame.BasicGame.mouse_or_keyboard = self.buttons['Controls'].state
 
-        # Each button returns a list of actions performed in the last frame. If the click action is performed
-        # then it will return true and execute the code in the IF block
-
-        if 'click' in self.buttons['Play'].handle_event(event):
-            self.change_scene(HelpScreen())
-        if 'click' in self.buttons['Controls'].handle_event(event):
-            BasicGame.BasicGame.mouse_or_keyboard = self.buttons['Controls'].state
-        if 'click' in self.buttons['Leaderboard'].handle_event(event):
-            self.change_scene(LeaderboardsScreen())
-        if 'click' in self.buttons['Quit'].handle_event(event):
-            pygame.quit()
-            sys.exit()
+    # Quits the same way closing the window does, so BasicGame still saves the profile and the replay
+    def quit(self):
+        pygame.event.post(pygame.event.Event(pygame.QUIT))
 
     def update(self, gametime):
         self.gametime = gametime
 
     def render(self, screen):
-
-        screen.blit(self.logo_image, (400 - self.logo_image.get_width() / 2, 10))
+        queue = self.render_queue
+        queue.push(self.logo_image, (400 - self.logo_image.get_width() / 2, 10))
         # Because each button is stored in a dictionary, you can easily iterate through and call their draw method
         for k, v in self.buttons.items():
-            v.draw(screen)
+            v.draw(queue)
+        queue.submit(screen)
 
 
 class LeaderboardsScreen(Scene):
-    def __init__(self):
+    # ranked is the store's ranked view, it is opened here if it isn't given
+    def __init__(self, ranked=None):
         self.buttons = {}
         self.leaderboards_box = Gui.LeaderboardsBox(20, 80, 760, 500)
-        try:
-            self.leaderboards_box.add_cell_data(pickle.load(open("scores.dat", "rb")))
-            # this sorts the list so the highest score is at the top. Defaults to small to big to you have to reverse it
-            self.leaderboards_box.cell_data.sort(key=operator.itemgetter('score'), reverse=True)
-        except:
-            self.leaderboards_box.cell_data = []
+        # The store keeps the scores sorted already, and the box only asks it for the rows it shows
+        self.leaderboards_box.add_cell_data(ranked if ranked is not None else ScoreStore.default().ranked())
         self.buttons['Main Menu'] = Gui.StandardButton((100, 20, 60, 30), 'Main Menu', font_size=40)
+        self.router = Events.EventRouter()
+        self.router.subscribe(lambda event, pressed_keys: self.leaderboards_box.handle_input(event),
+                              pygame.MOUSEBUTTONDOWN, pygame.MOUSEBUTTONUP, pygame.MOUSEMOTION)
+        self.router.add_widget(self.buttons['Main Menu'], lambda: self.change_scene(TitleScreen()))
         super().__init__()
 
-    def handle_input(self, event, pressed_keys):
-        self.leaderboards_box.handle_input(event)
-        if 'click' in self.buttons['Main Menu'].handle_event(event):
-            self.change_scene(TitleScreen())
+    # Opens the score store and reads the first page of it on the loading thread
+    @classmethod
+    def preload(cls):
+        def load():
+            Assets.font("8bitfont.ttf", 60)
+            Assets.font("Arial", 35)
+            ranked = ScoreStore.default().ranked()
+            # reads the first page now instead of on the first draw
+            if len(ranked):
+                ranked[0]
+            return ranked
+
+        return ScenePreload(load, cls)
 
     def update(self, gametime):
         self.leaderboards_box.update()
 
     def render(self, screen):
-        font = pygame.font.Font("8bitfont.ttf", 60)
-        title = font.render("Leaderboards", 0, (0, 0, 0))
-        screen.blit(title, (300, 20))
-        self.leaderboards_box.draw(screen)
+        title = Assets.text("8bitfont.ttf", 60, "Leaderboards", (0, 0, 0), False)
+        queue = self.render_queue
+        queue.push(title, (300, 20))
+        self.leaderboards_box.draw(queue)
         for k, v in self.buttons.items():
-            v.draw(screen)
+            v.draw(queue)
+        queue.submit(screen)
 
 
 class AddToLeaderboards(Scene):
-    def __init__(self, score):
+    def __init__(self, score, ranking=None):
         pygame.key.set_repeat(500, 50)
         self.buttons = {}
         self.score = score
+        # Where the score would go on the leaderboard. The ranking is loaded once and kept up to date by the store.
+        if ranking is None:
+            ranking = ScoreStore.default().ranking()
+        self.projected_rank = ranking.rank_of(score)
+        self.leaderboard_size = len(ranking) + 1
         self.buttons['Add'] = Gui.StandardButton((400, 350, 60, 30), "Add score", center_x=True, font_size=40)
-        self.font = pygame.font.SysFont('Arial', 30)
         self.textbox = Gui.TextBox(300, 200, 200, 45, enter_action=self.enter_action)
+        self.router = Events.EventRouter()
+        self.router.subscribe(lambda event, pressed_keys: self.textbox.handle_input(event),
+                              pygame.MOUSEBUTTONDOWN, pygame.KEYDOWN)
+        self.router.add_widget(self.buttons['Add'], self.enter_action)
         super().__init__()
 
+    # Building the ranking reads every score, so it is done on the loading thread. Make it with scene(score).
+    @classmethod
+    def preload(cls):
+        def load():
+            Assets.font("Arial", 60)
+            Assets.font("Arial", 30)
+            return ScoreStore.default().ranking()
+
+        return ScenePreload(load, lambda ranking, score: cls(score, ranking))
+
     def enter_action(self):
         self.write_score_to_file(self.score)
-        self.change_scene(LeaderboardsScreen())
-
-    def handle_input(self, event, pressed_keys):
-        self.textbox.handle_input(event)
-        if 'click' in self.buttons['Add'].handle_event(event):
-            self.write_score_to_file(self.score)
-            self.change_scene(LeaderboardsScreen())
+        self.change_scene_when_ready(LeaderboardsScreen.preload())
 
     def write_score_to_file(self, score):
-        # first read the file
-        try:
-            # load the scores into a variable
-            scores = pickle.load(open("scores.dat", "rb"))
-        except:
-            # if it cant find or open the file it creates an empty list
-            scores = []
-        # appends the new score on to the existing scores
-        scores.append({'name': self.textbox.get_text(), 'score': score})
-        # rewrites the entire file with the new list
-        pickle.dump(scores, open("scores.dat", "wb"))
+        # appends the new score on to the end of the score log, nothing else is read or rewritten
+        ScoreStore.default().add(self.textbox.get_text(), score)
 
     def update(self, gametime):
         self.textbox.update()
 
     def render(self, screen):
-        large_font = pygame.font.SysFont("Arial", 60)
-        title = large_font.render("Add your score!", 1, (0, 0, 0))
-        score = self.font.render("Score: " + str(self.score), 1, (0, 0, 0))
-        label = self.font.render("Name: ", 1, (0, 0, 0))
-        self.textbox.draw(screen)
-        screen.blit(label, (self.textbox.rect.x - label.get_width() - 10, self.textbox.rect.y))
-        screen.blit(title, (400 - title.get_width() / 2, 20))
-        screen.blit(score, (400 - score.get_width() / 2, 100))
+        title = Assets.text("Arial", 60, "Add your score!", (0, 0, 0))
+        score = Assets.text("Arial", 30, "Score: " + str(self.score), (0, 0, 0))
+        rank = Assets.text("Arial", 30, "Rank: %d of %d" % (self.projected_rank, self.leaderboard_size), (0, 0, 0))
+        label = Assets.text("Arial", 30, "Name: ", (0, 0, 0))
+        queue = self.render_queue
+        self.textbox.draw(queue)
+        queue.push(label, (self.textbox.rect.x - label.get_width() - 10, self.textbox.rect.y))
+        queue.push(title, (400 - title.get_width() / 2, 20))
+        queue.push(score, (400 - score.get_width() / 2, 100))
+        queue.push(rank, (400 - rank.get_width() / 2, 140))
         for k, v in self.buttons.items():
-            v.draw(screen)
+            v.draw(queue)
+        queue.submit(screen)
 
 
 class HelpScreen(Scene):
     def __init__(self):
-        self.font = pygame.font.SysFont('Arial', 25)
+        self.gametime = 0
         self.buttons = {}
         self.buttons['Start'] = Gui.StandardButton((400, 500, 60, 30), "Start!", center_x=True, font_size=40)
-        self.purple = pygame.image.load("images/purple.png").convert()
-        self.blue = pygame.image.load("images/blue.png").convert()
-        self.green = pygame.image.load("images/green.png").convert()
-        self.yellow = pygame.image.load("images/yellow.png").convert()
-        self.red = pygame.image.load("images/red.png").convert()
-        self.gold = pygame.image.load("images/gold.png").convert_alpha()
+        self.purple = Assets.image("purple")
+        self.blue = Assets.image("blue")
+        self.green = Assets.image("green")
+        self.yellow = Assets.image("yellow")
+        self.red = Assets.image("red")
+        self.gold = Assets.image("gold", alpha=True)
         self.text = [
             "Welcome to Breakout",
             "The aim of the game is to bounce the ball off the paddle and hit the blocks.",
@@ -160,27 +180,33 @@ class HelpScreen(Scene):
             "After 1 minute the speed increases, after 2 minutes the speed increases again.",
             "Don't let the ball hit the red line! You'll lose a life and you only have 3!",
             "Press left click or space to launch the ball."]
+        # The game is got ready while the help is read
+        self.game = GameScene.preload()
+        self.router = Events.EventRouter()
+        self.router.add_widget(self.buttons['Start'], lambda: self.change_scene_when_ready(self.game, self.gametime))
         super().__init__()
 
-    def handle_input(self, event, pressed_keys):
-        if 'click' in self.buttons['Start'].handle_event(event):
-            self.change_scene(GameScene(pygame.time.get_ticks()))
+    @classmethod
+    def preload(cls):
+        return ScenePreload(lambda: Assets.font("Arial", 25), lambda font: cls())
 
     def update(self, gametime):
-        pass
+        self.gametime = gametime
 
     def render(self, screen):
+        queue = self.render_queue
         y_start = 20
         for text in self.text:
-            x = self.font.render(text, 1, (0, 0, 0))
-            screen.blit(x, (20, y_start))
+            x = Assets.text("Arial", 25, text, (0, 0, 0))
+            queue.push(x, (20, y_start))
             y_start += 40
         for k, v in self.buttons.items():
-            v.draw(screen)
-
-        screen.blit(self.purple, (130, 145))
-        screen.blit(self.blue, (130, 185))
-        screen.blit(self.green, (130, 225))
-        screen.blit(self.yellow, (130, 265))
-        screen.blit(self.red, (130, 305))
-        screen.blit(self.gold, (700, 345))
+            v.draw(queue)
+
+        queue.push(self.purple, (130, 145))
+        queue.push(self.blue, (130, 185))
+        queue.push(self.green, (130, 225))
+        queue.push(self.yellow, (130, 265))
+        queue.push(self.red, (130, 305))
+        queue.push(self.gold, (700, 345))
+        queue.submit(screen)
@@ -0,0 +1,163 @@
+import argparse
+import collections
+import os
+import random
+import time
+
+# No window and no sound. These have to be set before pygame is imported.
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+os.environ.setdefault("PYGAME_HIDE_SUPPORT_PROMPT", "1")
+# SDL catches SIGINT and SIGTERM and turns them into QUIT events, which nothing reads when running headless
+os.environ.setdefault("SDL_NO_SIGNAL_HANDLERS", "1")
+
+import pygame
+
+import Assets
+import BasicGame
+from GameScene import FRAME_MS, GameScene
+
+
+# Plays the game by keeping the paddle under the ball and launching the ball whenever it is waiting.
+# Input sources are called once a frame with the frame number and the scene and return the events for that frame.
+class Autopilot(object):
+    def __init__(self, offset=0):
+        # how far from the centre of the paddle to hit the ball, so the ball doesn't just go straight up and down
+        self.offset = offset
+
+    def __call__(self, frame, scene):
+        x = self.target_x(scene)
+        if BasicGame.BasicGame.mouse_or_keyboard:
+            events = [pygame.event.Event(pygame.MOUSEMOTION, pos=(x, scene.paddle.rect.y), rel=(0, 0),
+                                         buttons=(0, 0, 0))]
+        else:
+            events = self.keyboard_events(scene, x)
+        if scene.new_game:
+            events.append(pygame.event.Event(pygame.MOUSEBUTTONDOWN, pos=(x, scene.paddle.rect.y), button=1))
+        return events
+
+    # Where the middle of the paddle should go this frame
+    def target_x(self, scene):
+        return scene.ball.rect.centerx + self.offset
+
+    def keyboard_events(self, scene, x):
+        paddle = scene.paddle
+        events = []
+        for key, pressed, held in ((pygame.K_LEFT, x < paddle.rect.centerx - 5, paddle.move_left),
+                                   (pygame.K_RIGHT, x > paddle.rect.centerx + 5, paddle.move_right)):
+            if pressed and not held:
+                events.append(pygame.event.Event(pygame.KEYDOWN, key=key, mod=0, unicode="", scancode=0))
+            elif held and not pressed:
+                events.append(pygame.event.Event(pygame.KEYUP, key=key, mod=0, unicode="", scancode=0))
+        return events
+
+
+# An autopilot that can miss. The paddle moves at most max_speed pixels a frame, and every time the ball starts
+# coming down it aims for a random spot around the ball, so some games are lost like they would be by a person.
+class SloppyAutopilot(Autopilot):
+    def __init__(self, seed=None, max_speed=9, aim_error=25):
+        super().__init__()
+        self.random = random.Random(seed)
+        self.max_speed = max_speed
+        self.aim_error = aim_error
+        self.x = None
+        self.falling = False
+
+    def target_x(self, scene):
+        if self.x is None:
+            self.x = scene.paddle.rect.centerx
+        falling = scene.ball.yspeed > 0
+        if falling and not self.falling:
+            self.offset = self.random.gauss(0, self.aim_error)
+        self.falling = falling
+        dx = scene.ball.rect.centerx + self.offset - self.x
+        self.x += max(-self.max_speed, min(self.max_speed, dx))
+        return int(self.x)
+
+
+# Plays back a fixed list of events. script maps a frame number to the events for that frame.
+class ScriptedInput(object):
+    def __init__(self, script):
+        self.script = script
+
+    def __call__(self, frame, scene):
+        return list(self.script.get(frame, ()))
+
+
+# Runs a GameScene without a display, a mixer or a frame cap. Time only moves on by frame_ms every frame,
+# so a run plays out exactly the same however fast the machine is.
+class HeadlessRunner(object):
+    def __init__(self, scene=None, input_source=None, frame_ms=FRAME_MS, render=False, size=(800, 600)):
+        init()
+        self.size = size
+        self.frame_ms = frame_ms
+        self.gametime = 0
+        self.frame = 0
+        self.scene = scene if scene is not None else GameScene(0, size)
+        self.input_source = input_source if input_source is not None else Autopilot()
+        # Rendering is optional, and goes to an off-screen surface
+        self.surface = pygame.Surface(size) if render else None
+        # Nothing is ever held down, scenes don't read this anyway
+        self.pressed_keys = collections.defaultdict(bool)
+
+    def finished(self):
+        return self.scene.game_over_state or self.scene.victory_state
+
+    # One frame, in the same order as BasicGame.handle_events, BasicGame.step and BasicGame.draw
+    def step(self):
+        self.gametime += self.frame_ms
+        for event in self.input_source(self.frame, self.scene):
+            self.scene.handle_input(event, self.pressed_keys)
+        self.scene.update(self.gametime)
+        if self.surface is not None:
+            self.surface.fill((255, 255, 255))
+            self.scene.render(self.surface)
+        self.frame += 1
+
+    # Runs until the game ends or max_frames have been run, and returns some stats about the run
+    def run(self, max_frames=None):
+        start_frame = self.frame
+        start = time.perf_counter()
+        while not self.finished() and (max_frames is None or self.frame - start_frame < max_frames):
+            self.step()
+        wall_time = time.perf_counter() - start
+        frames = self.frame - start_frame
+        return {
+            'frames': frames,
+            'wall_seconds': wall_time,
+            'frames_per_second': frames / wall_time if wall_time > 0 else 0.0,
+            'simulated_seconds': frames * self.frame_ms / 1000,
+            'score': self.scene.score,
+            'lives': self.scene.lives,
+            'level': self.scene.level,
+            'blocks_left': len(self.scene.blocks),
+            'finished': self.finished(),
+        }
+
+
+# Sets up just enough of pygame to run scenes: no window and no mixer
+def init():
+    pygame.display.init()
+    pygame.font.init()
+    Assets.preload()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run Breakout without a display and report how fast it runs")
+    parser.add_argument("--frames", type=int, default=36000, help="stop after this many frames (36000 is 10 minutes)")
+    parser.add_argument("--render", action="store_true", help="also render every frame to an off-screen surface")
+    parser.add_argument("--multiball", type=int, default=0, help="launch this many extra balls (needs numpy)")
+    parser.add_argument("--offset", type=int, default=7, help="where the autopilot hits the ball on the paddle")
+    parser.add_argument("--seed", type=int, default=None, help="seed for the game's random choices")
+    args = parser.parse_args()
+
+    init()
+    runner = HeadlessRunner(GameScene(0, (800, 600), args.multiball, args.seed), Autopilot(args.offset), render=args.render)
+    stats = runner.run(args.frames)
+    print("%(frames)d frames (%(simulated_seconds).1f s of play) in %(wall_seconds).2f s: "
+          "%(frames_per_second).0f frames/s" % stats)
+    print("score %(score)d, lives %(lives)d, level %(level)d, blocks left %(blocks_left)d" % stats)
+
+
+if __name__ == "__main__":
+    main()
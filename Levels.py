@@ -0,0 +1,210 @@
+import hashlib
+import os
+import re
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import Entities
+
+# Levels are text files in LEVEL_DIR called 1.lvl, 2.lvl and so on, played in order. A level file is a few settings,
+# one per line, then the line "rows" and the grid, one line per row of blocks:
+#
+#   # Anything after a # is a comment
+#   name Classic
+#   size 12 10        columns and rows
+#   origin 10 40      where the top left cell is on the screen
+#   cell 65 20        the size of a cell, blocks are drawn at the top left of theirs
+#   block 60 15       optional, the size of a block if it isn't the size of the block images
+#   rows
+#   12r
+#   3r 6. 3r *2
+#
+# A row is runs of cells: an optional count and then one of r y g b p for a block of that colour or . for an empty
+# cell. "3r 6. 3r" is three red blocks, six empty cells and three more red blocks. A row can end with *n to repeat
+# it n times. Rows shorter than the level are padded with empty cells, and rows missing from the bottom are empty,
+# so a 100x60 level of thousands of blocks can still be a handful of lines.
+LEVEL_DIR = "levels"
+
+# The colour of the block each letter is, None for an empty cell
+CELL_COLOURS = {
+    "r": "red",
+    "y": "yellow",
+    "g": "green",
+    "b": "blue",
+    "p": "purple",
+    ".": None,
+}
+RUN = re.compile(r"\s*(\d*)([%s])" % re.escape("".join(CELL_COLOURS)))
+REPEAT = re.compile(r"^(.*?)\s*\*\s*(\d+)$")
+
+
+class LevelError(Exception):
+    pass
+
+
+# A parsed level. cells has a byte for every cell, row by row: a colour code or Entities.EMPTY.
+class Level(object):
+    def __init__(self, name, columns, rows, origin, cell_size, block_size, cells):
+        self.name = name
+        self.columns = columns
+        self.rows = rows
+        self.origin = origin
+        self.cell_size = cell_size
+        self.block_size = block_size
+        self.cells = cells
+
+    def block_count(self):
+        return len(self.cells) - self.cells.count(Entities.EMPTY)
+
+
+def parse(text, source="<level>"):
+    settings = {}
+    grid = None
+    for number, line in enumerate(text.splitlines(), 1):
+        line = line.split("#", 1)[0].strip()
+        if not line:
+            continue
+        if grid is not None:
+            grid.append((number, line))
+        elif line == "rows":
+            grid = []
+        else:
+            key, _, value = line.partition(" ")
+            settings[key] = (number, value.split())
+    if grid is None:
+        raise LevelError("%s has no rows" % source)
+
+    def numbers(key, count, default=None):
+        if key not in settings:
+            if default is None:
+                raise LevelError("%s has no %s" % (source, key))
+            return default
+        number, values = settings[key]
+        if len(values) != count or not all(value.isdigit() for value in values):
+            raise LevelError("%s line %d: %s needs %d numbers" % (source, number, key, count))
+        return tuple(int(value) for value in values)
+
+    columns, rows = numbers("size", 2)
+    origin = numbers("origin", 2)
+    cell_size = numbers("cell", 2)
+    block_size = numbers("block", 2, ()) or None
+    name = " ".join(settings["name"][1]) if "name" in settings else source
+
+    codes = {letter: Entities.EMPTY if colour is None else Entities.COLOURS.index(colour)
+             for letter, colour in CELL_COLOURS.items()}
+    cells = bytearray()
+    for number, line in grid:
+        repeat = 1
+        match = REPEAT.match(line)
+        if match:
+            line, repeat = match.group(1), int(match.group(2))
+        row = bytearray()
+        end = 0
+        for run in RUN.finditer(line):
+            if run.start() != end:
+                break
+            row += bytes((codes[run.group(2)],)) * int(run.group(1) or 1)
+            end = run.end()
+        if end != len(line):
+            raise LevelError("%s line %d: can't read %r" % (source, number, line[end:].strip()))
+        if len(row) > columns:
+            raise LevelError("%s line %d: row has %d cells but the level is %d wide" % (source, number, len(row),
+                                                                                        columns))
+        cells += (row + bytes((Entities.EMPTY,)) * (columns - len(row))) * repeat
+        if len(cells) > columns * rows:
+            raise LevelError("%s line %d: more than %d rows" % (source, number, rows))
+    cells += bytes((Entities.EMPTY,)) * (columns * rows - len(cells))
+    return Level(name, columns, rows, origin, cell_size, block_size, bytes(cells))
+
+
+# Parsed levels by a hash of their file, so a level is only parsed again if its file changed
+cache = {}
+
+
+def load(path):
+    with open(path, "rb") as f:
+        data = f.read()
+    key = hashlib.blake2b(data, digest_size=16).digest()
+    level = cache.get(key)
+    if level is None:
+        try:
+            text = data.decode("utf-8")
+        except UnicodeDecodeError:
+            raise LevelError("%s is not a text file" % path)
+        level = parse(text, path)
+        cache[key] = level
+    return level
+
+
+def path_of(number):
+    return os.path.join(LEVEL_DIR, "%d.lvl" % number)
+
+
+# Returns the parsed level number, or None if there is no such level
+def load_level(number):
+    path = path_of(number)
+    if not os.path.exists(path):
+        return None
+    return load(path)
+
+
+# Makes the blocks of a level. Every block is filled in at once, however many there are.
+def build(level):
+    field = Entities.BlockField(level.columns, level.rows, level.origin, level.cell_size, level.block_size)
+    field.fill(level.cells)
+    return field
+
+
+def load_and_build(number):
+    level = load_level(number)
+    return build(level) if level is not None else None
+
+
+# One thread loads levels in the background, so building the next level never holds up a frame
+executor = None
+
+
+# Starts loading and building level number on the loading thread. Returns a Future of its BlockField, which is None
+# if there is no such level. Errors in the level are raised by the Future's result.
+def load_async(number):
+    global executor
+    if executor is None:
+        executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="levels")
+    return executor.submit(load_and_build, number)
+
+
+# Checks level files and says how long they take to load: python Levels.py [files]
+def main():
+    os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+    import Headless
+    Headless.init()
+
+    paths = sys.argv[1:]
+    if not paths:
+        paths = []
+        number = 1
+        while os.path.exists(path_of(number)):
+            paths.append(path_of(number))
+            number += 1
+
+    failed = False
+    for path in paths:
+        start = time.perf_counter()
+        try:
+            level = load(path)
+            parsed = time.perf_counter()
+            build(level)
+        except (OSError, LevelError) as e:
+            print("%s: %s" % (path, e))
+            failed = True
+            continue
+        built = time.perf_counter()
+        print("%s: %s, %dx%d, %d blocks, parsed in %.2f ms, built in %.2f ms" % (
+            path, level.name, level.columns, level.rows, level.block_count(), (parsed - start) * 1000,
+            (built - parsed) * 1000))
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,158 @@
+import Assets
+import Render
+
+# numpy is only needed for multiball, the rest of the game runs without it
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+# Lots of balls at once. Instead of a Ball object per ball, the positions, velocities and radii of every ball are
+# kept in numpy arrays and each step moves, bounces and checks all of them with a handful of array operations.
+# Velocities are in pixels per 60th of a second like Ball, but as plain x and y numbers.
+#
+# Blocks are looked up straight from the cells of an Entities.BlockField, through a numpy view of its alive mask,
+# so there is nothing to keep up to date when blocks are destroyed. Hits are checked at the front edge of each ball,
+# which is good enough as long as a ball moves less than a block height per step.
+class BallSystem(object):
+    def __init__(self, display_size, capacity=1024, radius=10, maxspeed=8.0):
+        if numpy is None:
+            raise ImportError("multiball needs numpy")
+        self.display_width, self.display_height = display_size
+        self.maxspeed = maxspeed
+        self.default_radius = radius
+
+        # Only the first count rows of each array are balls, the rest is room to grow
+        self.count = 0
+        self.pos = numpy.zeros((capacity, 2))
+        self.prev = numpy.zeros((capacity, 2))
+        self.vel = numpy.zeros((capacity, 2))
+        self.radius = numpy.zeros(capacity)
+
+        self.field = None
+        self.alive = None
+        self.image = Assets.image("ball", alpha=True, size=(radius * 2, radius * 2))
+
+    def __len__(self):
+        return self.count
+
+    # The balls hit the blocks in field. The gold block is hit as if it was the size of the others.
+    def set_blocks(self, field):
+        self.field = field
+        self.alive = numpy.frombuffer(field.alive, dtype=numpy.uint8)
+
+    def grow(self):
+        capacity = len(self.pos) * 2
+        for name in ("pos", "prev", "vel"):
+            array = numpy.zeros((capacity, 2))
+            array[:self.count] = getattr(self, name)[:self.count]
+            setattr(self, name, array)
+        radius = numpy.zeros(capacity)
+        radius[:self.count] = self.radius[:self.count]
+        self.radius = radius
+
+    # Adds a ball centred on (x, y)
+    def spawn(self, x, y, vx, vy, radius=None):
+        if self.count == len(self.pos):
+            self.grow()
+        i = self.count
+        self.pos[i] = self.prev[i] = (x, y)
+        self.vel[i] = (vx, vy)
+        self.radius[i] = self.default_radius if radius is None else radius
+        self.count += 1
+
+    # Drops every ball where keep is False, keeping the arrays packed at the front
+    def compact(self, keep):
+        n = int(keep.sum())
+        for array in (self.pos, self.prev, self.vel, self.radius):
+            array[:n] = array[:self.count][keep]
+        self.count = n
+
+    # Moves every ball one physics step. step_scale is the length of the step in 60ths of a second.
+    # Returns the indexes of the blocks that were hit this step, each one only once. Destroying them is up to the
+    # caller.
+    def update(self, step_scale, paddle_rect):
+        n = self.count
+        if n == 0:
+            return []
+        pos = self.pos[:n]
+        prev = self.prev[:n]
+        vel = self.vel[:n]
+        radius = self.radius[:n]
+
+        prev[:] = pos
+        pos += vel * step_scale
+
+        # walls
+        left = pos[:, 0] - radius <= 0
+        pos[left, 0] = radius[left]
+        vel[left, 0] = numpy.abs(vel[left, 0])
+        right = pos[:, 0] + radius >= self.display_width
+        pos[right, 0] = self.display_width - radius[right]
+        vel[right, 0] = -numpy.abs(vel[right, 0])
+        top = pos[:, 1] - radius <= 0
+        pos[top, 1] = radius[top]
+        vel[top, 1] = numpy.abs(vel[top, 1])
+
+        # paddle, only from above, at an angle depending on how far from the middle it was hit like Ball.bounce
+        crossed = (vel[:, 1] > 0) & (prev[:, 1] + radius <= paddle_rect.top) & (pos[:, 1] + radius >= paddle_rect.top)
+        over = (pos[:, 0] + radius >= paddle_rect.left) & (pos[:, 0] - radius <= paddle_rect.right)
+        paddle = crossed & over
+        if paddle.any():
+            dist = pos[paddle, 0] - paddle_rect.centerx
+            vel[paddle, 0] = numpy.copysign(numpy.maximum(self.maxspeed * numpy.abs(dist) / 40, 1), dist)
+            vel[paddle, 1] = -vel[paddle, 1]
+            pos[paddle, 1] = paddle_rect.top - radius[paddle]
+
+        hit = self.hit_blocks(pos, vel, radius)
+
+        # balls that fell past the paddle are gone
+        self.compact(pos[:, 1] - radius <= paddle_rect.bottom)
+        return hit
+
+    # Checks the front edge of every ball in the direction it is going, first up or down then left or right
+    def hit_blocks(self, pos, vel, radius):
+        if self.field is None or self.field.count == 0:
+            return []
+        # blocks hit on the first axis are taken out of this copy so the second axis can't hit them again
+        alive = self.alive.copy()
+        hit_blocks = []
+        for axis in (1, 0):
+            front = pos.copy()
+            front[:, axis] += numpy.sign(vel[:, axis]) * radius
+            blocks = self.lookup(front, alive)
+            hit = blocks >= 0
+            if not hit.any():
+                continue
+            vel[hit, axis] = -vel[hit, axis]
+            hit_blocks.append(blocks[hit])
+            alive[blocks[hit]] = 0
+
+        if not hit_blocks:
+            return []
+        # several balls can hit the same block in one step
+        return numpy.unique(numpy.concatenate(hit_blocks)).tolist()
+
+    # Returns the index of the block under each point that is alive in alive, or -1 for nothing
+    def lookup(self, points, alive):
+        field = self.field
+        local_x = points[:, 0] - field.origin[0]
+        local_y = points[:, 1] - field.origin[1]
+        cols = numpy.floor_divide(local_x, field.cell_width).astype(numpy.int64)
+        rows = numpy.floor_divide(local_y, field.cell_height).astype(numpy.int64)
+        inside = ((rows >= 0) & (rows < field.rows) & (cols >= 0) & (cols < field.columns)
+                  & (local_x - cols * field.cell_width < field.block_width)
+                  & (local_y - rows * field.cell_height < field.block_height))
+        blocks = numpy.full(len(points), -1, dtype=numpy.int64)
+        cells = rows[inside] * field.columns + cols[inside]
+        blocks[inside] = numpy.where(alive[cells] != 0, cells, -1)
+        return blocks
+
+    # interpolation works the same as Ball.draw
+    def draw(self, queue, interpolation=1.0):
+        n = self.count
+        if n == 0:
+            return
+        drawn = self.prev[:n] + (self.pos[:n] - self.prev[:n]) * interpolation - self.radius[:n, None]
+        queue.extend([(self.image, (x, y)) for x, y in drawn.round().astype(int).tolist()], Render.SPRITES)
@@ -0,0 +1,159 @@
+import csv
+import json
+import math
+import os
+import time
+from array import array
+from collections import deque
+
+import pygame
+
+import Assets
+
+PHASES = ("events", "update", "render", "present")
+
+
+# Times every frame, split into phases, and keeps the last capacity frames in a ring buffer. A frame is everything
+# from one begin_frame to the next, so its "total" includes the time spent waiting on the clock as well as the phases.
+#
+# BasicGame calls begin_frame at the top of the main loop and lap after each phase. lap charges the time since the
+# last lap (or the start of the frame) to the phase it is given.
+#
+# Scene changes are kept as well, with the time of the frame they happened in, because that is where a scene that
+# loads too much in its constructor shows up as a hitch.
+class FrameProfiler(object):
+    def __init__(self, capacity=600, phases=PHASES, refresh_every=30, max_transitions=100):
+        self.capacity = capacity
+        self.phases = phases
+        self.columns = phases + ("total",)
+        # one ring buffer of milliseconds per column, plus the number of the frame in each slot
+        self.samples = {column: array('d', bytes(8 * capacity)) for column in self.columns}
+        self.frame_numbers = array('q', bytes(8 * capacity))
+        self.count = 0
+        self.frame = 0
+
+        self.frame_start = None
+        self.last_lap = None
+        self.current = dict.fromkeys(phases, 0.0)
+
+        # the last max_transitions scene changes, oldest first, and the ones in the frame being timed
+        self.transitions = deque(maxlen=max_transitions)
+        self.frame_transitions = []
+
+        # percentiles shown on the overlay, only worked out again every refresh_every frames
+        self.refresh_every = refresh_every
+        self.stats = {}
+        self.stats_frame = None
+
+    def begin_frame(self):
+        now = time.perf_counter()
+        if self.frame_start is not None:
+            self.record((now - self.frame_start) * 1000)
+        self.frame_start = self.last_lap = now
+        self.current = dict.fromkeys(self.phases, 0.0)
+
+    def lap(self, phase):
+        if self.last_lap is None:
+            return
+        now = time.perf_counter()
+        self.current[phase] += (now - self.last_lap) * 1000
+        self.last_lap = now
+
+    # Called when the scene changes from source to target (their names). waited_ms is how long a LoadingScene
+    # was shown for, if source is one.
+    def transition(self, source, target, waited_ms=None):
+        self.frame_transitions.append({'from': source, 'to': target, 'waited_ms': waited_ms})
+
+    def record(self, frame_ms):
+        slot = self.frame % self.capacity
+        for phase in self.phases:
+            self.samples[phase][slot] = self.current[phase]
+        self.samples["total"][slot] = frame_ms
+        self.frame_numbers[slot] = self.frame
+        for transition in self.frame_transitions:
+            self.transitions.append(dict(transition, frame=self.frame, frame_ms=frame_ms))
+        self.frame_transitions = []
+        self.frame += 1
+        self.count = min(self.count + 1, self.capacity)
+
+    # Slots of the recorded frames, oldest first
+    def slots(self):
+        start = self.frame - self.count
+        return [i % self.capacity for i in range(start, self.frame)]
+
+    def values(self, column):
+        samples = self.samples[column]
+        return [samples[slot] for slot in self.slots()]
+
+    # p50, p95, p99 and max of every column in milliseconds
+    def summary(self):
+        summary = {}
+        for column in self.columns:
+            values = sorted(self.values(column))
+            if not values:
+                continue
+            summary[column] = {
+                'p50': percentile(values, 50),
+                'p95': percentile(values, 95),
+                'p99': percentile(values, 99),
+                'max': values[-1],
+            }
+        return summary
+
+    # Writes the buffer to path as CSV (one row per frame) or JSON (the frames and a summary), by the extension
+    def dump(self, path):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        slots = self.slots()
+        # the scene changes of each frame, as "From->To"
+        changes = {}
+        for transition in self.transitions:
+            changes.setdefault(transition['frame'], []).append("%(from)s->%(to)s" % transition)
+        if path.endswith(".csv"):
+            with open(path, "w", newline="") as f:
+                writer = csv.writer(f)
+                writer.writerow(("frame",) + self.columns + ("transition",))
+                for slot in slots:
+                    frame = self.frame_numbers[slot]
+                    writer.writerow([frame] + ["%.4f" % self.samples[column][slot] for column in self.columns]
+                                    + [" ".join(changes.get(frame, ()))])
+        else:
+            frames = [dict({column: self.samples[column][slot] for column in self.columns},
+                           frame=self.frame_numbers[slot]) for slot in slots]
+            with open(path, "w") as f:
+                json.dump({'capacity': self.capacity, 'phases': list(self.phases), 'summary': self.summary(),
+                           'frames': frames, 'transitions': list(self.transitions)}, f, indent=1)
+        return path
+
+    # Draws a table of p50/p95/p99 per phase in the top left corner and returns the rect drawn on
+    def draw(self, screen, x=0, y=20):
+        if self.stats_frame is None or self.frame - self.stats_frame >= self.refresh_every:
+            self.stats = self.summary()
+            self.stats_frame = self.frame
+
+        lines = ["%-8s %6s %6s %6s" % ("ms", "p50", "p95", "p99")]
+        for column in self.columns:
+            if column in self.stats:
+                s = self.stats[column]
+                lines.append("%-8s %6.2f %6.2f %6.2f" % (column, s['p50'], s['p95'], s['p99']))
+        if self.transitions:
+            last = self.transitions[-1]
+            lines.append("%s->%s %.2f ms" % (last['from'], last['to'], last['frame_ms']))
+        surfaces = [Assets.text("Courier New,monospace", 14, line, (0, 0, 0)) for line in lines]
+        rect = pygame.Rect(x, y, max(surface.get_width() for surface in surfaces) + 8,
+                           sum(surface.get_height() for surface in surfaces) + 6)
+        screen.fill((255, 255, 200), rect)
+        line_y = y + 3
+        for surface in surfaces:
+            screen.blit(surface, (x + 4, line_y))
+            line_y += surface.get_height()
+        return rect
+
+
+# Nearest rank percentile of an already sorted list, None if it is empty. BatchSim uses it too.
+def percentile(values, p):
+    if not values:
+        return None
+    rank = max(1, math.ceil(p * len(values) / 100))
+    return values[min(rank, len(values)) - 1]
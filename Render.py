@@ -0,0 +1,51 @@
+# Layers, drawn lowest first. Things on the same layer are drawn in the order they were pushed.
+BACKGROUND = 0
+# text, buttons and boxes
+UI = 1
+# the paddle and the balls, which go over the text like they always have
+SPRITES = 2
+OVERLAY = 3
+
+
+# Collects everything a scene draws in a frame, then draws it all with one Surface.blits call instead of a blit
+# call per surface, so drawing a few thousand blocks or balls costs little more than drawing a few.
+#
+# Scenes and the things in them push (surface, position, layer) while they render, and the scene submits the queue to
+# the surface it is drawing on. Surfaces are drawn when the queue is submitted, not when they are pushed, so a surface
+# mustn't be drawn on again between the two.
+class RenderQueue(object):
+    def __init__(self):
+        # the blits of each layer, in the order they were pushed
+        self.layers = {}
+
+    # dest is a position or a rect, area the part of surface to draw (all of it if it isn't given)
+    def push(self, surface, dest, layer=UI, area=None):
+        blits = self.layers.get(layer)
+        if blits is None:
+            blits = self.layers[layer] = []
+        blits.append((surface, dest) if area is None else (surface, dest, area))
+
+    # Pushes a list of (surface, dest) or (surface, dest, area) all on one layer
+    def extend(self, blits, layer=UI):
+        if layer in self.layers:
+            self.layers[layer].extend(blits)
+        else:
+            self.layers[layer] = list(blits)
+
+    def __len__(self):
+        return sum(len(blits) for blits in self.layers.values())
+
+    def clear(self):
+        self.layers.clear()
+
+    # Draws everything pushed since the last submit onto target and empties the queue. Returns the rects drawn on.
+    def submit(self, target):
+        layers = self.layers
+        if len(layers) == 1:
+            blits, = layers.values()
+        else:
+            blits = []
+            for layer in sorted(layers):
+                blits += layers[layer]
+        layers.clear()
+        return target.blits(blits)
@@ -0,0 +1,291 @@
+import argparse
+import collections
+import hashlib
+import os
+import struct
+import sys
+import time
+
+import pygame
+
+import BasicGame
+from GameScene import GameScene
+
+# A replay is everything needed to play a game again exactly as it went: the seed of the game's random choices,
+# the game time of its first step and the input before every physics step. The input is delta encoded, so a
+# step where nothing changed takes no space at all and a 3 minute game is usually a few kilobytes.
+#
+# Layout: HEADER, then one record for every step where the input changed. A record is a varint with the number
+# of steps since the last record, a byte of FLAGS and, if the mouse moved, a zigzag varint of how far it moved.
+MAGIC = b"BRKRPLY1"
+HEADER = struct.Struct("<8s?QdddHHHI16s")
+
+# FLAGS. LEFT and RIGHT are whether the arrow keys are held, the rest are things that happened before the step.
+MOVED = 1
+CLICK = 2
+SPACE = 4
+LEFT = 8
+RIGHT = 16
+HELD = LEFT | RIGHT
+
+
+class ReplayError(Exception):
+    pass
+
+
+def write_varint(data, value):
+    while value >= 0x80:
+        data.append(value & 0x7f | 0x80)
+        value >>= 7
+    data.append(value)
+
+
+# Returns (value, position after it)
+def read_varint(data, pos):
+    value = 0
+    shift = 0
+    while True:
+        if pos >= len(data):
+            raise ReplayError("replay data ends in the middle of a number")
+        byte = data[pos]
+        pos += 1
+        value |= (byte & 0x7f) << shift
+        if byte < 0x80:
+            return value, pos
+        shift += 7
+
+
+# Small negative numbers become small positive ones, so they fit in a one byte varint too
+def zigzag(value):
+    return value * 2 if value >= 0 else -value * 2 - 1
+
+
+def unzigzag(value):
+    return value // 2 if value % 2 == 0 else -(value + 1) // 2
+
+
+# Everything that decides how the rest of a game goes. Two runs of the same recording must end with the same hash.
+def state_hash(scene):
+    ball = scene.ball
+    state = (scene.score, scene.lives, scene.level, scene.time_in_play, scene.running, scene.new_game, scene.game_over_state,
+             scene.victory_state, ball.pos_x, ball.pos_y, ball.xspeed, ball.yspeed, ball.direction,
+             tuple(scene.paddle.rect), bytes(scene.blocks.alive), bytes(scene.blocks.colours), scene.blocks.gold)
+    digest = hashlib.blake2b(repr(state).encode("utf-8"), digest_size=16)
+    if scene.balls is not None:
+        digest.update(scene.balls.pos[:scene.balls.count].tobytes())
+        digest.update(scene.balls.vel[:scene.balls.count].tobytes())
+    return digest.digest()
+
+
+# Records the input a GameScene gets. BasicGame passes it every event with observe and calls step just before
+# every update of the scene.
+class Recorder(object):
+    def __init__(self, scene, step_ms):
+        self.scene = scene
+        self.step_ms = step_ms
+        self.mouse = BasicGame.BasicGame.mouse_or_keyboard
+        self.start_time = scene.gametime
+        self.first_time = None
+        self.steps = 0
+        self.data = bytearray()
+
+        # what was written in the last record. The mouse position isn't known until it first moves.
+        self.last_step = 0
+        self.x = None
+        self.held = 0
+
+        # input since the last step
+        self.keys = 0
+        self.events = 0
+        self.pending_x = None
+
+    def observe(self, event):
+        if event.type == pygame.MOUSEMOTION:
+            # the mouse is ignored when playing with the keyboard, so it isn't worth keeping
+            if self.mouse:
+                self.pending_x = event.pos[0]
+        elif event.type == pygame.MOUSEBUTTONDOWN:
+            if event.button == 1:
+                self.events |= CLICK
+        elif event.type == pygame.KEYDOWN:
+            if event.key == pygame.K_SPACE:
+                self.events |= SPACE
+            elif event.key == pygame.K_LEFT:
+                self.keys |= LEFT
+            elif event.key == pygame.K_RIGHT:
+                self.keys |= RIGHT
+        elif event.type == pygame.KEYUP:
+            if event.key == pygame.K_LEFT:
+                self.keys &= ~LEFT
+            elif event.key == pygame.K_RIGHT:
+                self.keys &= ~RIGHT
+
+    def step(self, gametime):
+        if self.first_time is None:
+            self.first_time = gametime
+        moved = self.pending_x is not None and self.pending_x != self.x
+        flags = self.events | self.keys | (MOVED if moved else 0)
+        if flags & ~HELD or self.keys != self.held:
+            write_varint(self.data, self.steps - self.last_step)
+            self.data.append(flags)
+            if moved:
+                write_varint(self.data, zigzag(self.pending_x - (self.x or 0)))
+                self.x = self.pending_x
+            self.held = self.keys
+            self.last_step = self.steps
+        self.events = 0
+        self.pending_x = None
+        self.steps += 1
+
+    def recording(self):
+        first_time = self.first_time if self.first_time is not None else self.start_time
+        return Recording(self.mouse, self.scene.seed, self.start_time, first_time, self.step_ms, self.scene.multiball,
+                         (self.scene.width, self.scene.height), self.steps, state_hash(self.scene), bytes(self.data))
+
+    def save(self, path):
+        save(self.recording(), path)
+
+
+class Recording(object):
+    def __init__(self, mouse, seed, start_time, first_time, step_ms, multiball, size, steps, final_hash, data):
+        self.mouse = mouse
+        self.seed = seed
+        self.start_time = start_time
+        self.first_time = first_time
+        self.step_ms = step_ms
+        self.multiball = multiball
+        self.size = size
+        self.steps = steps
+        self.final_hash = final_hash
+        self.data = data
+
+    # Yields (x, flags) for every step. x is where the mouse moved to before the step, or None if it didn't move.
+    def inputs(self):
+        pos = 0
+        x = 0
+        held = 0
+        next_step = None
+        if pos < len(self.data):
+            next_step, pos = read_varint(self.data, pos)
+        for step in range(self.steps):
+            if step != next_step:
+                yield None, held
+                continue
+            if pos >= len(self.data):
+                raise ReplayError("replay data ends in the middle of a record")
+            flags = self.data[pos]
+            pos += 1
+            moved_to = None
+            if flags & MOVED:
+                dx, pos = read_varint(self.data, pos)
+                x += unzigzag(dx)
+                moved_to = x
+            held = flags & HELD
+            yield moved_to, flags
+            if pos < len(self.data):
+                skip, pos = read_varint(self.data, pos)
+                next_step = step + skip
+
+
+def save(recording, path):
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    width, height = recording.size
+    with open(path + ".tmp", "wb") as f:
+        f.write(HEADER.pack(MAGIC, recording.mouse, recording.seed, recording.start_time, recording.first_time,
+                            recording.step_ms, recording.multiball, width, height, recording.steps,
+                            recording.final_hash))
+        f.write(recording.data)
+    os.replace(path + ".tmp", path)
+
+
+def load(path):
+    with open(path, "rb") as f:
+        header = f.read(HEADER.size)
+        data = f.read()
+    if len(header) < HEADER.size:
+        raise ReplayError("%s is too short to be a replay" % path)
+    (magic, mouse, seed, start_time, first_time, step_ms, multiball, width, height, steps,
+     final_hash) = HEADER.unpack(header)
+    if magic != MAGIC:
+        raise ReplayError("%s is not a replay" % path)
+    return Recording(mouse, seed, start_time, first_time, step_ms, multiball, (width, height), steps, final_hash, data)
+
+
+# Turns one step of a recording back into the events the scene got
+def input_events(scene, x, flags, held):
+    events = []
+    y = scene.paddle.rect.y
+    if x is not None:
+        events.append(pygame.event.Event(pygame.MOUSEMOTION, pos=(x, y), rel=(0, 0), buttons=(0, 0, 0)))
+    for key, bit in ((pygame.K_LEFT, LEFT), (pygame.K_RIGHT, RIGHT)):
+        if flags & bit and not held & bit:
+            events.append(pygame.event.Event(pygame.KEYDOWN, key=key, mod=0, unicode="", scancode=0))
+        elif held & bit and not flags & bit:
+            events.append(pygame.event.Event(pygame.KEYUP, key=key, mod=0, unicode="", scancode=0))
+    if flags & SPACE:
+        events.append(pygame.event.Event(pygame.KEYDOWN, key=pygame.K_SPACE, mod=0, unicode=" ", scancode=0))
+    if flags & CLICK:
+        events.append(pygame.event.Event(pygame.MOUSEBUTTONDOWN, pos=(scene.paddle.rect.centerx, y), button=1))
+    return events
+
+
+# Plays a recording as fast as possible without drawing anything, and returns the scene it ends with.
+# pygame.display has to be initialised first (Headless.init does it).
+def replay(recording):
+    mouse_or_keyboard = BasicGame.BasicGame.mouse_or_keyboard
+    BasicGame.BasicGame.mouse_or_keyboard = recording.mouse
+    try:
+        scene = GameScene(recording.start_time, recording.size, recording.multiball, recording.seed)
+        # the same additions as BasicGame.main_loop, so every step gets exactly the same game time
+        gametime = recording.first_time
+        held = 0
+        # nothing reads it, like in HeadlessRunner
+        pressed_keys = collections.defaultdict(bool)
+        for x, flags in recording.inputs():
+            for event in input_events(scene, x, flags, held):
+                scene.handle_input(event, pressed_keys)
+            held = flags & HELD
+            scene.update(gametime)
+            gametime += recording.step_ms
+    finally:
+        BasicGame.BasicGame.mouse_or_keyboard = mouse_or_keyboard
+    return scene
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Play a recorded game again as fast as possible and check it ends "
+                                                 "the same way")
+    parser.add_argument("replay", nargs="?", default=BasicGame.BasicGame.replay_path)
+    args = parser.parse_args()
+
+    # sets up the dummy video and audio drivers
+    import Headless
+    Headless.init()
+
+    try:
+        recording = load(args.replay)
+    except (OSError, ReplayError) as e:
+        print("Could not load replay: %s" % e, file=sys.stderr)
+        return 2
+
+    start = time.perf_counter()
+    scene = replay(recording)
+    wall_time = time.perf_counter() - start
+
+    print("%d steps (%.1f s of play) in %.2f s: %.0f steps/s" % (
+        recording.steps, recording.steps * recording.step_ms / 1000, wall_time,
+        recording.steps / wall_time if wall_time > 0 else 0.0))
+    print("seed %d, score %d, lives %d, level %d, blocks left %d" % (recording.seed, scene.score, scene.lives,
+                                                                     scene.level, len(scene.blocks)))
+    final_hash = state_hash(scene)
+    if final_hash != recording.final_hash:
+        print("state hash MISMATCH: recorded %s, replayed %s" % (recording.final_hash.hex(), final_hash.hex()))
+        return 1
+    print("state hash matches: %s" % final_hash.hex())
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,11 +1,33 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import Assets
+import Render
+
+
 class Scene:
     """ Very simply scene system for easily changing scenes """
 
+    # Scenes that can be drawn with dirty rectangles implement render_background, take_background_changes
+    # and render_dynamic as well as render
+    supports_dirty_rendering = False
+
+    # How far between the last two updates the scene is being drawn, 0 to 1. Set by BasicGame before render.
+    interpolation = 1.0
+
+    # Scenes that subscribe their handlers and widgets to an Events.EventRouter set it here, and then don't need
+    # their own handle_input
+    router = None
+
     def __init__(self):
         self.next_scene = self
+        # what render pushes the frame onto before drawing it all at once
+        self.render_queue = Render.RenderQueue()
 
     def handle_input(self, event, pressed_keys):
-        raise NotImplementedError
+        if self.router is None:
+            raise NotImplementedError
+        self.router.dispatch(event, pressed_keys)
 
     def update(self, gametime):
         raise NotImplementedError
@@ -15,3 +37,60 @@ class Scene:
 
     def change_scene(self, next_scene):
         self.next_scene = next_scene
+
+    # Changes to the scene preload is getting ready, passing args on to make it. If it isn't ready yet a
+    # LoadingScene is shown until it is.
+    def change_scene_when_ready(self, preload, *args):
+        if preload.ready():
+            self.change_scene(preload.scene(*args))
+        else:
+            self.change_scene(LoadingScene(preload, args))
+
+
+# One thread gets scenes ready in the background
+executor = None
+
+
+# A scene being got ready ahead of time, usually by the scene before it. load runs on the loading thread and does the
+# slow work that doesn't need the display, like reading files and opening fonts. make is called with what load
+# returned, and the args given to scene, on the main thread to make the scene itself.
+class ScenePreload(object):
+    def __init__(self, load, make):
+        global executor
+        if executor is None:
+            executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="scenes")
+        self.future = executor.submit(load)
+        self.make = make
+
+    def ready(self):
+        return self.future.done()
+
+    # Waits for load if it hasn't finished, and raises anything it raised
+    def scene(self, *args):
+        return self.make(self.future.result(), *args)
+
+
+# Shown while waiting for a ScenePreload, and swapped for its scene as soon as it is ready
+class LoadingScene(Scene):
+    def __init__(self, preload, args=()):
+        self.preload = preload
+        self.args = args
+        self.started = time.perf_counter()
+        # how long the scene was waited for, once it is ready
+        self.waited_ms = None
+        super().__init__()
+
+    def handle_input(self, event, pressed_keys):
+        pass
+
+    def update(self, gametime):
+        if self.next_scene is self and self.preload.ready():
+            self.waited_ms = (time.perf_counter() - self.started) * 1000
+            self.change_scene(self.preload.scene(*self.args))
+
+    def render(self, screen):
+        dots = int((time.perf_counter() - self.started) * 4) % 4
+        text = Assets.text("8bitfont.ttf", 40, "Loading" + "." * dots, (0, 0, 0), False)
+        width, height = screen.get_size()
+        self.render_queue.push(text, (width / 2 - text.get_width() / 2, height / 2 - text.get_height() / 2))
+        self.render_queue.submit(screen)
@@ -0,0 +1,618 @@
+import argparse
+from bisect import bisect_left, bisect_right, insort
+import csv
+import heapq
+import io
+from itertools import groupby, islice
+import json
+from operator import itemgetter
+import os
+import pickle
+import struct
+import sys
+import threading
+import time
+import zlib
+
+# Scores are kept in two files:
+#
+# scores.log is append only. Every record is a header (crc32, score, length of the name) followed by the name in
+# UTF-8. The crc covers the score and the name, so a record that was only half written when the game crashed is
+# spotted and cut off the next time the store is opened. Adding a score is one write at the end of the file.
+#
+# scores.idx is every score in leaderboard order (highest first, ties in the order they were added) as fixed size
+# (score, offset into the log) entries, so entry i can be read on its own. It is rebuilt every compact_every scores.
+# The scores added since then (the tail) are kept in memory and merged in when reading.
+RECORD_HEADER = struct.Struct("<IiI")
+INDEX_MAGIC = b"BRKSIDX1"
+INDEX_HEADER = struct.Struct("<8sQQ")
+INDEX_ENTRY = struct.Struct("<iQ")
+
+DEFAULT_PATH = "scores.log"
+LEGACY_PATH = "scores.dat"
+
+
+def record_crc(score, name_bytes):
+    return zlib.crc32(struct.pack("<i", score) + name_bytes) & 0xffffffff
+
+
+# Leaderboard order: highest score first, then the one that was added first
+def sort_key(entry):
+    return -entry[0], entry[1]
+
+
+class ScoreStore(object):
+    def __init__(self, path=DEFAULT_PATH, compact_every=256, legacy_path=LEGACY_PATH):
+        self.path = path
+        self.index_path = os.path.splitext(path)[0] + ".idx"
+        self.compact_every = compact_every
+        # Scenes are got ready on their own thread (see Scene.ScenePreload) and read the leaderboard there while the
+        # game can be adding to it, so everything that seeks and reads or writes the files holds this
+        self.lock = threading.RLock()
+
+        is_new = not os.path.exists(path)
+        self.log = open(path, "a+b")
+        self.index = None
+        self.index_count = 0
+        # built the first time someone asks for a rank
+        self.rank_table = None
+        # (score, offset) of every record that isn't in the index yet, in leaderboard order
+        self.tail = []
+        # index_position of the tail entries that have been looked up, until the index changes
+        self.tail_positions = {}
+
+        self.load_index()
+        self.recover_tail()
+
+        if is_new and legacy_path is not None and os.path.exists(legacy_path):
+            self.migrate_pickle(legacy_path)
+
+    def __len__(self):
+        with self.lock:
+            return self.index_count + len(self.tail)
+
+    # Opens the index if it matches the log, otherwise the index is rebuilt from the whole log
+    def load_index(self):
+        log_length = os.path.getsize(self.path)
+        try:
+            index = open(self.index_path, "rb")
+        except FileNotFoundError:
+            index = None
+
+        if index is not None:
+            header = index.read(INDEX_HEADER.size)
+            if len(header) == INDEX_HEADER.size:
+                magic, count, covered = INDEX_HEADER.unpack(header)
+                expected_size = INDEX_HEADER.size + count * INDEX_ENTRY.size
+                if magic == INDEX_MAGIC and covered <= log_length and os.fstat(index.fileno()).st_size == expected_size:
+                    self.index = index
+                    self.index_count = count
+                    self.index_covered = covered
+                    return
+            index.close()
+
+        self.index_count = 0
+        self.index_covered = 0
+        if log_length > 0:
+            self.recover_tail()
+            self.compact()
+
+    # Reads every record after the part of the log the index covers. Anything after the last complete record
+    # is what was left by a crash in the middle of a write, so it is cut off.
+    def recover_tail(self):
+        self.tail = []
+        self.tail_positions = {}
+        offset = self.index_covered
+        for offset, end, score, name in self.read_records(offset):
+            self.tail.append((score, offset))
+            offset = end
+        self.log.seek(0, os.SEEK_END)
+        if self.log.tell() != offset:
+            print("ScoreStore: dropping %d bytes of incomplete score data from %s" % (self.log.tell() - offset,
+                                                                                     self.path), file=sys.stderr)
+            self.log.truncate(offset)
+            self.log.flush()
+            os.fsync(self.log.fileno())
+        self.tail.sort(key=sort_key)
+
+    # Yields (offset, end, score, name) for every good record from offset onwards and stops at the first bad one
+    def read_records(self, offset):
+        self.log.seek(offset)
+        while True:
+            header = self.log.read(RECORD_HEADER.size)
+            if len(header) < RECORD_HEADER.size:
+                return
+            crc, score, name_length = RECORD_HEADER.unpack(header)
+            name_bytes = self.log.read(name_length)
+            if len(name_bytes) < name_length or record_crc(score, name_bytes) != crc:
+                return
+            end = offset + RECORD_HEADER.size + name_length
+            yield offset, end, score, name_bytes.decode("utf-8", "replace")
+            offset = end
+
+    def read_record(self, offset):
+        with self.lock:
+            self.log.seek(offset)
+            crc, score, name_length = RECORD_HEADER.unpack(self.log.read(RECORD_HEADER.size))
+            return {'name': self.log.read(name_length).decode("utf-8", "replace"), 'score': score}
+
+    def add(self, name, score):
+        self.add_many([(name, score)])
+
+    # Appends a batch of (name, score) pairs with one write and one fsync
+    def add_many(self, scores):
+        with self.lock:
+            self.log.seek(0, os.SEEK_END)
+            offset = self.log.tell()
+            chunk = []
+            added = []
+            for name, score in scores:
+                score = int(score)
+                name_bytes = str(name).encode("utf-8")
+                chunk.append(RECORD_HEADER.pack(record_crc(score, name_bytes), score, len(name_bytes)))
+                chunk.append(name_bytes)
+                added.append((score, offset))
+                offset += RECORD_HEADER.size + len(name_bytes)
+            if not added:
+                return 0
+
+            self.log.write(b"".join(chunk))
+            self.log.flush()
+            os.fsync(self.log.fileno())
+
+            # the new offsets are bigger than every other offset, so they go after any equal scores
+            self.tail = list(heapq.merge(self.tail, sorted(added, key=sort_key), key=sort_key))
+            if self.rank_table is not None:
+                for score, offset in added:
+                    self.rank_table.insert(score)
+            if len(self.tail) >= self.compact_every:
+                self.compact()
+            return len(added)
+
+    def index_entry(self, i):
+        with self.lock:
+            self.index.seek(INDEX_HEADER.size + i * INDEX_ENTRY.size)
+            return INDEX_ENTRY.unpack(self.index.read(INDEX_ENTRY.size))
+
+    def index_entries(self, start, end):
+        with self.lock:
+            if self.index is None or start >= end:
+                return []
+            self.index.seek(INDEX_HEADER.size + start * INDEX_ENTRY.size)
+            data = self.index.read((end - start) * INDEX_ENTRY.size)
+            return list(INDEX_ENTRY.iter_unpack(data))
+
+    # Streams every indexed entry in order without loading the whole index
+    def iter_index(self, chunk=4096):
+        for start in range(0, self.index_count, chunk):
+            for entry in self.index_entries(start, min(self.index_count, start + chunk)):
+                yield entry
+
+    # Merges the tail into the index. The new index is written next to the old one and swapped in,
+    # so a crash during compaction leaves the old index (which recover_tail can still use).
+    def compact(self):
+        with self.lock:
+            self.log.seek(0, os.SEEK_END)
+            covered = self.log.tell()
+            count = 0
+            temp_path = self.index_path + ".tmp"
+            with open(temp_path, "wb") as f:
+                f.write(INDEX_HEADER.pack(INDEX_MAGIC, 0, covered))
+                merged = heapq.merge(self.iter_index(), self.tail, key=sort_key)
+                for entries in batches(merged, 4096):
+                    f.write(b"".join([INDEX_ENTRY.pack(score, offset) for score, offset in entries]))
+                    count += len(entries)
+                f.seek(0)
+                f.write(INDEX_HEADER.pack(INDEX_MAGIC, count, covered))
+                f.flush()
+                os.fsync(f.fileno())
+
+            if self.index is not None:
+                self.index.close()
+            os.replace(temp_path, self.index_path)
+            self.index = open(self.index_path, "rb")
+            self.index_count = count
+            self.index_covered = covered
+            self.tail = []
+            self.tail_positions = {}
+
+    # Returns the leaderboard entries from position start up to (not including) end as {'name', 'score'} dicts.
+    # Only the index entries around that range and the records that are returned are read from disk.
+    def entries(self, start, end):
+        with self.lock:
+            end = min(end, len(self))
+            if start >= end:
+                return []
+
+            # Position of an indexed entry = its index position + the tail entries that come before it,
+            # and the other way around for tail entries. The tail is short so it is searched in memory.
+            tail_keys = [sort_key(entry) for entry in self.tail]
+            found = []
+            lo = max(0, start - len(self.tail))
+            for i, entry in enumerate(self.index_entries(lo, min(end, self.index_count)), lo):
+                position = i + bisect_left(tail_keys, sort_key(entry))
+                if start <= position < end:
+                    found.append((position, entry[1]))
+            for j, entry in enumerate(self.tail):
+                position = j + self.tail_index_position(entry)
+                if start <= position < end:
+                    found.append((position, entry[1]))
+
+            found.sort()
+            return [self.read_record(offset) for position, offset in found]
+
+    # Number of indexed entries that come before entry, found with a binary search over the index file
+    def index_position(self, entry):
+        with self.lock:
+            key = sort_key(entry)
+            lo, hi = 0, self.index_count
+            while lo < hi:
+                mid = (lo + hi) // 2
+                if sort_key(self.index_entry(mid)) < key:
+                    lo = mid + 1
+                else:
+                    hi = mid
+            return lo
+
+    # index_position of a tail entry. Only compact changes the index, so each one is searched for once until then.
+    def tail_index_position(self, entry):
+        position = self.tail_positions.get(entry)
+        if position is None:
+            position = self.tail_positions[entry] = self.index_position(entry)
+        return position
+
+    def top(self, n):
+        return self.entries(0, n)
+
+    def page(self, k, page_size):
+        return self.entries(k * page_size, (k + 1) * page_size)
+
+    # Every score in leaderboard order, streamed from the index and merged with the tail
+    def iter_scores(self):
+        for score, offset in heapq.merge(self.iter_index(), self.tail, key=sort_key):
+            yield score
+
+    # Every entry as a {'name', 'score'} dict in leaderboard order, streamed like iter_scores
+    def iter_entries(self):
+        for score, offset in heapq.merge(self.iter_index(), self.tail, key=sort_key):
+            yield self.read_record(offset)
+
+    # The names of every score of exactly score points, read from that score's run in the index and from the tail
+    def names_with_score(self, score, chunk=4096):
+        start = self.index_position((score, -1))
+        end = self.index_position((score - 1, -1))
+        for chunk_start in range(start, end, chunk):
+            for entry_score, offset in self.index_entries(chunk_start, min(end, chunk_start + chunk)):
+                yield self.read_record(offset)['name']
+        for entry_score, offset in list(self.tail):
+            if entry_score == score:
+                yield self.read_record(offset)['name']
+
+    # The Ranking of every score, loaded once and then kept up to date as scores are added
+    def ranking(self):
+        with self.lock:
+            if self.rank_table is None:
+                self.rank_table = Ranking(self.iter_scores())
+            return self.rank_table
+
+    # A read only list-like view of the whole leaderboard for LeaderboardsBox. Rows are fetched a page at a time.
+    def ranked(self, page_size=32):
+        return RankedView(self, page_size)
+
+    # Imports the old pickled list of {'name', 'score'} dicts. The pickle is left where it is.
+    def migrate_pickle(self, legacy_path):
+        try:
+            with open(legacy_path, "rb") as f:
+                scores = pickle.load(f)
+            migrated = [(item['name'], item['score']) for item in scores]
+        except (OSError, EOFError, pickle.UnpicklingError, TypeError, KeyError, ValueError) as e:
+            print("ScoreStore: could not migrate %s: %s" % (legacy_path, e), file=sys.stderr)
+            return 0
+        count = self.add_many(migrated)
+        self.compact()
+        return count
+
+    def close(self):
+        with self.lock:
+            if self.index is not None:
+                self.index.close()
+                self.index = None
+            self.log.close()
+
+
+# Answers "what rank would this score get" and "what score is needed for this rank" with a binary search.
+# The scores are kept negated in ascending order, which is leaderboard order, so bisect works on them directly.
+class Ranking(object):
+    def __init__(self, scores=()):
+        self.negated = sorted(-score for score in scores)
+
+    def __len__(self):
+        return len(self.negated)
+
+    # A new score goes after everyone with the same score, like it does in the store, so its rank is
+    # one more than the number of scores that are at least as good
+    def rank_of(self, score):
+        return bisect_right(self.negated, -score) + 1
+
+    # The lowest whole number score that would be placed at rank or better
+    def score_needed(self, rank):
+        if rank < 1:
+            raise ValueError("ranks start at 1")
+        if rank > len(self.negated):
+            return 0
+        return -self.negated[rank - 1] + 1
+
+    def insert(self, score):
+        insort(self.negated, -score)
+
+
+class RankedView(object):
+    def __init__(self, store, page_size):
+        self.store = store
+        self.page_size = page_size
+        self.cached_page = None
+        self.cached_length = None
+        self.cached_rows = []
+
+    def __len__(self):
+        return len(self.store)
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError(index)
+        page = index // self.page_size
+        if page != self.cached_page or len(self.store) != self.cached_length:
+            self.cached_rows = self.store.page(page, self.page_size)
+            self.cached_page = page
+            self.cached_length = len(self.store)
+        return self.cached_rows[index % self.page_size]
+
+
+store = None
+store_lock = threading.Lock()
+
+
+# The store the game uses, opened the first time it is needed and kept open after that
+def default():
+    global store
+    with store_lock:
+        if store is None:
+            store = ScoreStore()
+    return store
+
+
+# Bulk import and export, for merging the scores of other machines after an event:
+#
+#   python ScoreStore.py import results.csv other_machine.jsonl
+#   python ScoreStore.py export leaderboard.csv
+#
+# Files are CSV with a header row that has name and score columns, or JSON Lines with a {"name": ..., "score": ...}
+# object on every line. An import streams every file through a pipeline of generators (read, validate, batch), drops
+# the duplicates in each batch and writes it with one add_many. Duplicates are found by reading the names of the
+# stored scores with the same points, so memory only ever holds one batch however big the store or the files are.
+# An export streams straight out of the index and the log.
+FORMATS = {".csv": "csv", ".jsonl": "jsonl", ".ndjson": "jsonl"}
+IMPORT_BATCH = 50000
+# Longest name an import accepts, in characters
+MAX_NAME_LENGTH = 100
+# Scores are stored as signed 32 bit numbers
+MAX_SCORE = 2 ** 31 - 1
+
+
+class ScoreFileError(Exception):
+    pass
+
+
+def format_of(path):
+    file_format = FORMATS.get(os.path.splitext(path)[1].lower())
+    if file_format is None:
+        raise ScoreFileError("can't tell the format of %s, give it with --format" % path)
+    return file_format
+
+
+# Yields (line number, record) for every row after the header
+def read_csv(f, source):
+    reader = csv.DictReader(f)
+    if reader.fieldnames is None or not {'name', 'score'} <= set(reader.fieldnames):
+        raise ScoreFileError("%s needs a header row with name and score columns" % source)
+    for row in reader:
+        yield reader.line_num, row
+
+
+# Yields (line number, record) for every line that isn't blank. A line that isn't JSON is yielded as None.
+def read_jsonl(f, source):
+    for number, line in enumerate(f, 1):
+        if not line.strip():
+            continue
+        try:
+            yield number, json.loads(line)
+        except ValueError:
+            yield number, None
+
+
+# Why record can't be imported, or None if it can
+def problem(record):
+    if not isinstance(record, dict):
+        return "not a {name, score} record"
+    name = record.get('name')
+    score = record.get('score')
+    if not isinstance(name, str):
+        return "no name"
+    if len(name) > MAX_NAME_LENGTH:
+        return "name longer than %d characters" % MAX_NAME_LENGTH
+    if not name.isprintable():
+        return "name has control characters"
+    number = whole_number(score)
+    if number is None:
+        return "score %r isn't a whole number" % (score,)
+    if not 0 <= number <= MAX_SCORE:
+        return "score %d is out of range" % number
+    return None
+
+
+# A score as an int, from an int or a string of digits, or None if it is neither
+def whole_number(value):
+    if isinstance(value, str):
+        value = value.strip()
+        if not value.isdecimal():
+            return None
+        try:
+            return int(value)
+        except ValueError:
+            return None
+    if isinstance(value, bool) or not isinstance(value, int):
+        return None
+    return value
+
+
+# Yields (name, score) for every good record. report is called with (line number, problem) for the others.
+def validate(records, report):
+    for number, record in records:
+        reason = problem(record)
+        if reason is None:
+            yield record['name'], whole_number(record['score'])
+        else:
+            report(number, reason)
+
+
+# The scores in batch that aren't already in store and aren't repeated in batch, in batch order for scores with the
+# same points. Each score's names are only compared with the stored names of that score, which are streamed from
+# the store. counts['duplicate'] is how many were dropped.
+def new_scores(store, batch, counts):
+    unique = []
+    for score, group in groupby(sorted(batch, key=itemgetter(1)), key=itemgetter(1)):
+        # dict keys keep the order the names came in
+        names = {}
+        for name, score in group:
+            if name in names:
+                counts['duplicate'] += 1
+            names[name] = None
+        for name in store.names_with_score(score):
+            if name in names:
+                del names[name]
+                counts['duplicate'] += 1
+                if not names:
+                    break
+        unique.extend((name, score) for name in names)
+    return unique
+
+
+def batches(items, size):
+    items = iter(items)
+    while True:
+        batch = list(islice(items, size))
+        if not batch:
+            return
+        yield batch
+
+
+def open_input(path):
+    if path == "-":
+        return io.TextIOWrapper(sys.stdin.buffer, encoding="utf-8", newline="")
+    return open(path, "r", encoding="utf-8", newline="")
+
+
+def open_output(path):
+    if path == "-":
+        return io.TextIOWrapper(sys.stdout.buffer, encoding="utf-8", newline="")
+    return open(path, "w", encoding="utf-8", newline="")
+
+
+# Imports every file in paths into store, skipping bad records and scores it already has. report is called with
+# (path, line number, problem) for every bad record. Returns counts of the records that were read, added, invalid
+# and duplicates.
+def import_scores(store, paths, file_format=None, batch_size=IMPORT_BATCH, report=None):
+    counts = dict.fromkeys(("read", "added", "invalid", "duplicate"), 0)
+    for path in paths:
+        source = "<stdin>" if path == "-" else path
+        path_format = file_format or format_of(path)
+        reader = read_csv if path_format == "csv" else read_jsonl
+
+        def rejected(number, reason):
+            counts['invalid'] += 1
+            if report is not None:
+                report(source, number, reason)
+
+        with open_input(path) as f:
+            records = reader(f, source)
+            for batch in batches(validate(records, rejected), batch_size):
+                # so nothing gets in between checking a batch and adding it
+                with store.lock:
+                    counts['added'] += store.add_many(new_scores(store, batch, counts))
+    counts['read'] = counts['added'] + counts['invalid'] + counts['duplicate']
+    return counts
+
+
+# Writes the whole leaderboard to f, best first, and returns how many scores were written
+def export_scores(store, f, file_format):
+    count = 0
+    if file_format == "csv":
+        writer = csv.writer(f)
+        writer.writerow(("rank", "name", "score"))
+        for count, entry in enumerate(store.iter_entries(), 1):
+            writer.writerow((count, entry['name'], entry['score']))
+    else:
+        for count, entry in enumerate(store.iter_entries(), 1):
+            f.write(json.dumps({'rank': count, 'name': entry['name'], 'score': entry['score']},
+                               ensure_ascii=False) + "\n")
+    return count
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Import scores into the leaderboard or export it")
+    parser.add_argument("--store", default=DEFAULT_PATH, help="the score log to use")
+    parser.add_argument("--format", choices=sorted(set(FORMATS.values())),
+                        help="the file format, if it can't be told from the file name (- is always stdin/stdout)")
+    commands = parser.add_subparsers(dest="command", required=True)
+    importer = commands.add_parser("import", help="add the scores in CSV or JSON Lines files")
+    importer.add_argument("paths", nargs="+", metavar="file")
+    importer.add_argument("--batch-size", type=int, default=IMPORT_BATCH, help="scores written at a time")
+    exporter = commands.add_parser("export", help="write the whole leaderboard as CSV or JSON Lines")
+    exporter.add_argument("path", metavar="file")
+    args = parser.parse_args()
+
+    paths = args.paths if args.command == "import" else [args.path]
+    if "-" in paths and args.format is None:
+        parser.error("give --format to read or write - (stdin or stdout)")
+
+    if args.command == "export" and not os.path.exists(args.store):
+        print("there is no score log at %s" % args.store, file=sys.stderr)
+        return 1
+    # only the game's own store takes in the old pickled scores
+    store = ScoreStore(args.store, legacy_path=LEGACY_PATH if args.store == DEFAULT_PATH else None)
+    start = time.perf_counter()
+    try:
+        if args.command == "export":
+            with open_output(args.path) as f:
+                count = export_scores(store, f, args.format or format_of(args.path))
+            print("exported %d scores in %.2f s" % (count, time.perf_counter() - start), file=sys.stderr)
+            return 0
+
+        shown = 0
+
+        # only the first few bad records are shown, the rest are just counted
+        def report(source, number, reason):
+            nonlocal shown
+            if shown < 10:
+                print("%s line %d: %s" % (source, number, reason), file=sys.stderr)
+                shown += 1
+
+        counts = import_scores(store, args.paths, args.format, args.batch_size, report=report)
+        print("read %(read)d scores: added %(added)d, %(duplicate)d duplicates, %(invalid)d invalid" % counts
+              + " in %.2f s" % (time.perf_counter() - start), file=sys.stderr)
+        return 1 if counts['invalid'] else 0
+    except (OSError, ScoreFileError) as e:
+        print(e, file=sys.stderr)
+        return 1
+    except (UnicodeDecodeError, csv.Error) as e:
+        # the batches before the bad part of the file have already been added
+        print("can't read the file: %s" % e, file=sys.stderr)
+        return 1
+    finally:
+        store.close()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
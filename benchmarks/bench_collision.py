@@ -0,0 +1,64 @@
+# Compares the old linear ball-vs-block scan against the uniform grid broadphase and BlockField's cell lookup.
+# Run from the project root: python benchmarks/bench_collision.py
+import os
+import random
+import sys
+import timeit
+
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import pygame
+
+import Collision
+
+import fields
+
+BLOCK_COUNTS = [120, 1000, 10000]
+
+
+# Just a rect, like anything else that goes in a UniformGrid
+class Item(object):
+    __slots__ = ("rect",)
+
+    def __init__(self, rect):
+        self.rect = rect
+
+
+def main():
+    pygame.init()
+    pygame.display.set_mode((800, 600))
+    rng = random.Random(1)
+
+    print("%8s %14s %14s %14s" % ("blocks", "linear (us)", "grid (us)", "field (us)"))
+    for count in BLOCK_COUNTS:
+        field = fields.block_field(count)
+        blocks = [Item(field.rect(i)) for i in field.live()]
+        grid = Collision.UniformGrid(65, 20, (10, 40))
+        for block in blocks:
+            grid.insert(block)
+
+        # ball positions spread over the whole level
+        height = 40 + 20 * (count // 12 + 1)
+        balls = [pygame.Rect(rng.randint(0, 780), rng.randint(0, height), 20, 20) for _ in range(200)]
+
+        def linear():
+            for ball in balls:
+                [block for block in blocks if ball.colliderect(block.rect)]
+
+        def broadphase():
+            for ball in balls:
+                grid.colliding(ball)
+
+        def lookup():
+            for ball in balls:
+                field.colliding(ball)
+
+        linear_time = min(timeit.repeat(linear, number=5, repeat=3)) / (5 * len(balls))
+        grid_time = min(timeit.repeat(broadphase, number=5, repeat=3)) / (5 * len(balls))
+        field_time = min(timeit.repeat(lookup, number=5, repeat=3)) / (5 * len(balls))
+        print("%8d %14.2f %14.2f %14.2f" % (count, linear_time * 1e6, grid_time * 1e6, field_time * 1e6))
+
+
+if __name__ == "__main__":
+    main()
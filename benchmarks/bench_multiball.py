@@ -0,0 +1,70 @@
+# Per-step cost of moving N balls with the numpy BallSystem against looping over Entities.Ball objects
+# (move, walls, paddle and a BlockField lookup for blocks each).
+# Run from the project root: python benchmarks/bench_multiball.py
+import os
+import random
+import sys
+import timeit
+
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import pygame
+
+import Entities
+import Multiball
+
+import fields
+
+BALL_COUNTS = [10, 100, 1000, 5000]
+DISPLAY_SIZE = (800, 600)
+
+
+def main():
+    pygame.init()
+    pygame.display.set_mode(DISPLAY_SIZE)
+    # A paddle as wide as the screen so no ball is ever lost and the count stays the same
+    paddle = pygame.Rect(0, DISPLAY_SIZE[1] - 50, DISPLAY_SIZE[0], 15)
+
+    print("%8s %16s %16s %10s" % ("balls", "Ball loop (ms)", "numpy (ms)", "speedup"))
+    for count in BALL_COUNTS:
+        rng = random.Random(1)
+        starts = [(rng.uniform(20, 780), rng.uniform(260, 520), rng.uniform(-8, 8), rng.choice((-4.0, 4.0)))
+                  for _ in range(count)]
+
+        # Blocks are never destroyed here, so both versions do the same amount of work every step
+        field = fields.block_field(120)
+        balls = []
+        for x, y, vx, vy in starts:
+            ball = Entities.Ball(x - 10, y - 10, DISPLAY_SIZE)
+            ball.xspeed = abs(vx)
+            ball.direction = "Right" if vx > 0 else "Left"
+            ball.yspeed = -vy
+            balls.append(ball)
+
+        def loop():
+            for ball in balls:
+                ball.update()
+                if ball.rect.colliderect(paddle):
+                    ball.bounce(ball.rect.centerx - paddle.centerx)
+                for block in field.colliding(ball.rect):
+                    ball.bounce()
+                if ball.rect.bottom > paddle.top:
+                    ball.yspeed = abs(ball.yspeed)
+
+        system = Multiball.BallSystem(DISPLAY_SIZE, capacity=count)
+        system.set_blocks(field)
+        for x, y, vx, vy in starts:
+            system.spawn(x, y, vx, vy)
+
+        def vectorized():
+            system.update(1.0, paddle)
+
+        steps = 20
+        loop_time = min(timeit.repeat(loop, number=steps, repeat=3)) / steps
+        numpy_time = min(timeit.repeat(vectorized, number=steps, repeat=3)) / steps
+        print("%8d %16.3f %16.3f %9.1fx" % (count, loop_time * 1000, numpy_time * 1000, loop_time / numpy_time))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,48 @@
+# Time from starting the game to the first TitleScreen frame, loading assets from the individual files
+# and from the asset bundle. Every run is a fresh process so nothing is cached between them.
+# Run from the project root: python benchmarks/bench_startup.py
+import os
+import subprocess
+import sys
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+RUNS = 5
+
+# Runs in the child process: builds the game without entering the main loop and draws one frame
+CHILD = """
+import time
+start = time.perf_counter()
+import BasicGame
+BasicGame.BasicGame.bundle_path = %r
+game = BasicGame.BasicGame.__new__(BasicGame.BasicGame)
+init_start = time.perf_counter()
+game.initialize()
+game.draw(0)
+end = time.perf_counter()
+print(end - start, end - init_start)
+"""
+
+
+def time_to_title(bundle_path):
+    env = dict(os.environ, SDL_VIDEODRIVER="dummy", SDL_AUDIODRIVER="dummy", PYGAME_HIDE_SUPPORT_PROMPT="1")
+    out = subprocess.run([sys.executable, "-c", CHILD % bundle_path], cwd=ROOT, env=env, check=True,
+                         stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, universal_newlines=True).stdout
+    total, initialize = out.strip().splitlines()[-1].split()
+    return float(total), float(initialize)
+
+
+def main():
+    if not os.path.exists(os.path.join(ROOT, "assets.bundle")):
+        subprocess.run([sys.executable, "Bundle.py"], cwd=ROOT, check=True,
+                       env=dict(os.environ, PYGAME_HIDE_SUPPORT_PROMPT="1"))
+
+    for label, bundle_path in (("files", None), ("bundle", "assets.bundle")):
+        runs = [time_to_title(bundle_path) for _ in range(RUNS)]
+        totals = sorted(total for total, initialize in runs)
+        initializes = sorted(initialize for total, initialize in runs)
+        print("%-8s to title: median %7.1f ms   initialize + first frame: median %7.1f ms"
+              % (label, totals[RUNS // 2] * 1000, initializes[RUNS // 2] * 1000))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,10 @@
+# Block fields for the benchmarks, shared so they all time the same layout
+import Entities
+
+
+# count blocks on the same 65x20 lattice as levels/1.lvl, 12 columns wide, coloured two rows at a time like it
+def block_field(count):
+    field = Entities.BlockField(12, (count + 11) // 12)
+    for i in range(count):
+        field.add(i % 12, i // 12, Entities.COLOURS[(i // 24) % Entities.GOLD])
+    return field
@@ -0,0 +1,224 @@
+# The benchmark suite. Times the parts of the game that matter for frame rate and start up, writes the results to
+# JSON and compares them against benchmarks/baseline.json. Exits with 1 if any metric got slower than the baseline
+# by more than its threshold, so it can be used as a check before merging.
+#
+# Run from the project root: python benchmarks/suite.py
+# After a change that is meant to make things faster (or on a new machine): python benchmarks/suite.py --update-baseline
+#
+# Every metric is milliseconds per operation, lower is better, and is the fastest of a few repeats, over a few runs of
+# the whole suite, to keep the noise down. The baseline only means anything on the machine it was recorded on.
+import argparse
+import json
+import os
+import random
+import sys
+import time
+import timeit
+
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+os.environ.setdefault("PYGAME_HIDE_SUPPORT_PROMPT", "1")
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, ROOT)
+
+import pygame
+
+import Assets
+import Entities
+import Gui
+import Render
+from GameScene import GameScene
+
+import bench_startup
+import fields
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+BASELINE_PATH = os.path.join(BENCH_DIR, "baseline.json")
+RESULTS_PATH = os.path.join(BENCH_DIR, "results.json")
+DEFAULT_THRESHOLD = 25
+
+UPDATE_BLOCK_COUNTS = [12, 60, 120, 240]
+LEADERBOARD_SIZES = [10, 1000, 100000]
+
+
+# Returns the fastest time of one call of func in milliseconds
+def time_ms(func, number, repeat=7):
+    return min(timeit.repeat(func, number=number, repeat=repeat)) / number * 1000
+
+
+# A scene with count blocks on the usual 65x20 lattice instead of the usual 120, with the ball already launched
+def make_scene(count):
+    scene = GameScene(0, (800, 600), seed=1)
+    scene.blocks = fields.block_field(count)
+    scene.launch()
+    return scene
+
+
+def bench_game_scene_init():
+    return time_ms(lambda: GameScene(0, (800, 600), seed=1), number=20)
+
+
+# Each repeat plays the same 1200 updates from a fresh scene, with the paddle kept under the ball so it stays in
+# play. Only the updates are timed, not making the scene.
+def bench_game_scene_update(count, steps=1200, repeat=7):
+    best = None
+    for r in range(repeat):
+        scene = make_scene(count)
+        gametime = 0
+        start = time.perf_counter()
+        for i in range(steps):
+            scene.paddle.rect.centerx = scene.ball.rect.centerx + 7
+            gametime += 1000 / 120
+            scene.update(gametime)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best / steps * 1000
+
+
+def bench_game_scene_render(screen):
+    scene = make_scene(120)
+    scene.update(1000 / 120)
+
+    def render():
+        screen.fill((255, 255, 255))
+        scene.render(screen)
+
+    return time_ms(render, number=50)
+
+
+# Draws the box while scrolling through the table a little every frame, like dragging the scrollbar
+def bench_leaderboards_draw(screen, size):
+    box = Gui.LeaderboardsBox(20, 80, 760, 500)
+    rng = random.Random(size)
+    box.add_cell_data([{'name': "player%d" % i, 'score': rng.randint(0, 5000)} for i in range(size)])
+    max_scroll = box.max_scroll()
+
+    queue = Render.RenderQueue()
+
+    def draw():
+        box.scroll_to((box.scroll_y + 7) % (max_scroll + 1))
+        box.update()
+        box.draw(queue)
+        queue.submit(screen)
+
+    return time_ms(draw, number=100)
+
+
+def bench_standard_button():
+    return time_ms(lambda: Gui.StandardButton((400, 350, 60, 30), 'Main Menu', center_x=True, font_size=40),
+                   number=200)
+
+
+# Median of a few fresh processes, so nothing is cached between runs. Always loads the individual files,
+# whether or not a bundle has been built.
+def bench_title_frame(runs=5):
+    totals = sorted(bench_startup.time_to_title(None)[0] for _ in range(runs))
+    return totals[runs // 2] * 1000
+
+
+def run(selected=None, verbose=True):
+    pygame.init()
+    screen = pygame.display.set_mode((800, 600))
+    Assets.preload()
+
+    benchmarks = [("game_scene.init", bench_game_scene_init)]
+    for count in UPDATE_BLOCK_COUNTS:
+        benchmarks.append(("game_scene.update.blocks_%d" % count, lambda count=count: bench_game_scene_update(count)))
+    benchmarks.append(("game_scene.render", lambda: bench_game_scene_render(screen)))
+    for size in LEADERBOARD_SIZES:
+        benchmarks.append(("leaderboards_box.draw.entries_%d" % size,
+                           lambda size=size: bench_leaderboards_draw(screen, size)))
+    benchmarks.append(("standard_button.init", bench_standard_button))
+    benchmarks.append(("startup.title_frame", bench_title_frame))
+
+    results = {}
+    for name, func in benchmarks:
+        if selected and not any(name.startswith(prefix) for prefix in selected):
+            continue
+        results[name] = func()
+        if verbose:
+            print("%-40s %10.4f ms" % (name, results[name]))
+    return results
+
+
+# Runs the suite runs times and keeps the fastest time of every metric
+def run_best(selected=None, runs=3):
+    best = {}
+    for i in range(runs):
+        print("run %d of %d" % (i + 1, runs))
+        for name, value in run(selected, verbose=False).items():
+            best[name] = min(value, best.get(name, value))
+    for name, value in best.items():
+        print("%-40s %10.4f ms" % (name, value))
+    return best
+
+
+# Returns the metrics that got slower than the baseline by more than their threshold, as (name, baseline, now, %)
+def compare(results, baseline, threshold=None):
+    regressions = []
+    thresholds = baseline.get('thresholds', {})
+    default = threshold if threshold is not None else baseline.get('default_threshold', DEFAULT_THRESHOLD)
+    for name, value in sorted(results.items()):
+        expected = baseline.get('metrics', {}).get(name)
+        if expected is None or expected <= 0:
+            continue
+        change = (value - expected) / expected * 100
+        limit = thresholds.get(name, default) if threshold is None else threshold
+        status = "REGRESSED" if change > limit else "ok"
+        print("%-40s %10.4f ms  baseline %10.4f ms  %+7.1f%% (limit %d%%)  %s"
+              % (name, value, expected, change, limit, status))
+        if change > limit:
+            regressions.append((name, expected, value, change))
+    return regressions
+
+
+def load_baseline(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the benchmarks and compare them against the baseline")
+    parser.add_argument("only", nargs="*", help="only run metrics whose names start with one of these")
+    parser.add_argument("--runs", type=int, default=3, help="run everything this many times and keep the fastest")
+    parser.add_argument("--out", default=RESULTS_PATH, help="where to write the results")
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    parser.add_argument("--threshold", type=int, default=None,
+                        help="percent slower than the baseline that counts as a regression, for every metric "
+                             "(default: the thresholds in the baseline file)")
+    parser.add_argument("--update-baseline", action="store_true",
+                        help="save these results as the new baseline instead of comparing against it")
+    args = parser.parse_args()
+
+    os.chdir(ROOT)
+    results = run_best(args.only, args.runs)
+    with open(args.out, "w") as f:
+        json.dump({'metrics': results}, f, indent=2, sort_keys=True)
+
+    baseline = load_baseline(args.baseline)
+    if args.update_baseline:
+        baseline = baseline or {'default_threshold': DEFAULT_THRESHOLD, 'thresholds': {}}
+        baseline.setdefault('metrics', {}).update(results)
+        with open(args.baseline, "w") as f:
+            json.dump(baseline, f, indent=2, sort_keys=True)
+            f.write("\n")
+        print("baseline written to %s" % args.baseline)
+        return 0
+    if baseline is None:
+        print("no baseline at %s, run with --update-baseline to make one" % args.baseline)
+        return 0
+
+    print()
+    regressions = compare(results, baseline, args.threshold)
+    if regressions:
+        print("\n%d metric(s) regressed: %s" % (len(regressions), ", ".join(name for name, *rest in regressions)))
+        return 1
+    print("\nno regressions")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())